@@ -1,15 +1,19 @@
 from flask import Flask, render_template
 from flask_login import LoginManager
-from models import db
 from models.user import User
 from config import Config
+from utils.engine import init_database
+from utils.startup import init_startup
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     
+    # Template bytecode cache, before anything creates the Jinja environment
+    init_startup(app)
+    
     # Initialize extensions
-    db.init_app(app)
+    init_database(app)
     
     # Login manager
     login_manager = LoginManager()
@@ -17,9 +21,28 @@ def create_app():
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = 'info'
     
+    from utils.cache import init_cache
+    init_cache(app)
+    
+    # Logged-in users come from a small identity cache, not a query per request
+    from utils.identity import init_identity_cache, load_identity
+    init_identity_cache(app)
+    
+    # Password hashing runs in a bounded worker pool, off the request thread
+    from utils.passwords import init_passwords
+    init_passwords(app)
+    
+    # Outbox delivery transport (see utils/notifications.py)
+    from utils.notifications import init_notifications
+    init_notifications(app)
+    
+    # Per-request SQL statement counting and QUERY_BUDGETS enforcement
+    from utils.profiling import init_query_budgets
+    init_query_budgets(app)
+    
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_identity(int(user_id))
     
     # Register blueprints
     from routes.auth_routes import auth_bp
@@ -27,24 +50,30 @@ def create_app():
     from routes.member_routes import member_bp
     from routes.transaction_routes import transaction_bp
     from routes.admin_routes import admin_bp
+    from routes.api_routes import api_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(book_bp)
     app.register_blueprint(member_bp)
     app.register_blueprint(transaction_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(api_bp)
     
     @app.route('/')
     def index():
         return render_template('index.html')
     
+    from commands import register_commands
+    register_commands(app)
+    
     return app
 
 if __name__ == '__main__':
     app = create_app()
     
     with app.app_context():
-        db.create_all()
+        from utils.migrations import upgrade_database
+        upgrade_database()
         from utils.seed_data import create_dummy_data
         if User.query.count() == 0:
             create_dummy_data()
@@ -0,0 +1,123 @@
+"""Hammer checkout/check-in from many threads and verify the inventory invariants.
+
+    python benchmarks/circulation_stress.py --threads 16 --iterations 200 --copies 3
+
+Exits non-zero if available_copies ever goes negative, drifts from
+total_copies minus open loans, or a member ends up with two open loans of
+the same book.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--copies', type=int, default=3)
+    parser.add_argument('--books', type=int, default=2)
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(), 'stress.db')
+
+    from sqlalchemy import func
+    from sqlalchemy.exc import OperationalError
+    from app import create_app
+    from models import db
+    from models.book import Book
+    from models.user import User
+    from models.transaction import Transaction
+    from utils.migrations import upgrade_database
+    from utils import circulation
+    from utils.circulation import CirculationError
+    from utils.stats import get_counters
+
+    app = create_app()
+    with app.app_context():
+        upgrade_database()
+        for i in range(args.books):
+            db.session.add(Book(title=f'Stress {i}', author='Bench', isbn=f'stress-{i}',
+                                category='Bench', total_copies=args.copies,
+                                available_copies=args.copies))
+        for i in range(args.users):
+            db.session.add(User(username=f'stress{i}', email=f'stress{i}@example.com',
+                                password_hash='!', first_name='Stress', last_name=str(i)))
+        db.session.commit()
+        book_ids = [b.id for b in Book.query.all()]
+        user_ids = [u.id for u in User.query.all()]
+
+    results = {'borrowed': 0, 'returned': 0, 'rejected': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(args.iterations):
+            with app.app_context():
+                user_id = rng.choice(user_ids)
+                try:
+                    if rng.random() < 0.6:
+                        circulation.checkout(user_id, rng.choice(book_ids))
+                        outcome = 'borrowed'
+                    else:
+                        loan = Transaction.query.filter_by(user_id=user_id, status='borrowed').first()
+                        if loan is None:
+                            continue
+                        circulation.checkin(loan)
+                        outcome = 'returned'
+                    db.session.commit()
+                except CirculationError:
+                    db.session.rollback()
+                    outcome = 'rejected'
+                except OperationalError:
+                    db.session.rollback()
+                    outcome = 'locked'
+            with lock:
+                results[outcome] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    failures = []
+    with app.app_context():
+        for book in Book.query.all():
+            open_loans = Transaction.query.filter_by(book_id=book.id, status='borrowed').count()
+            if book.available_copies < 0:
+                failures.append(f'{book.title}: available_copies is {book.available_copies}')
+            if book.available_copies + open_loans != book.total_copies:
+                failures.append(f'{book.title}: {book.available_copies} available + '
+                                f'{open_loans} on loan != {book.total_copies} copies')
+        duplicates = db.session.query(Transaction.user_id, Transaction.book_id).filter_by(
+            status='borrowed').group_by(Transaction.user_id, Transaction.book_id).having(
+            func.count() > 1).all()
+        if duplicates:
+            failures.append(f'duplicate open loans: {duplicates}')
+        open_total = Transaction.query.filter_by(status='borrowed').count()
+        if get_counters()['borrowed'].count != open_total:
+            failures.append('borrowed counter does not match open loans')
+
+    operations = sum(results.values())
+    print(f'{operations} operations in {elapsed:.2f}s ({operations / elapsed:.0f} ops/s): {results}')
+    for failure in failures:
+        print(f'INVARIANT VIOLATED: {failure}')
+    if failures:
+        sys.exit(1)
+    print('All inventory invariants hold.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""Replay a realistic traffic mix against the app and report per-endpoint latency.
+
+    python benchmarks/endpoints.py --users 5000 --books 20000 --clients 8 --seconds 30 \
+        --output results.json [--compare baseline.json]
+
+The app is built with create_app() against a generated dataset (or an
+existing one via --database-url). Each client thread logs in as its own
+member and picks requests from the mix below; a reports request goes
+through a librarian session. Results per endpoint are throughput, latency
+percentiles and SQL query counts (from the X-Query-Count header), written
+as JSON so two commits can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# name: weight in the mix
+TRAFFIC_MIX = {
+    'catalog': 25,
+    'search': 15,
+    'book_details': 25,
+    'borrow_book': 8,
+    'return_book': 7,
+    'dashboard': 15,
+    'reports': 5,
+}
+
+SEARCH_TERMS = ['fiction', 'science book', 'history', 'author 7', 'computer', 'art book 1',
+                'mathematics', 'biography', 'physics 2', 'literature']
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    results = {}
+    for name, rows in sorted(samples.items()):
+        latencies = sorted(latency for latency, _, _ in rows)
+        queries = [count for _, count, _ in rows if count is not None]
+        results[name] = {
+            'requests': len(rows),
+            'errors': sum(1 for _, _, ok in rows if not ok),
+            'throughput': round(len(rows) / elapsed, 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_app(args):
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(), 'bench.db')
+    os.environ.setdefault('DB_ENGINE_PROFILE', args.engine_profile)
+
+    from app import create_app
+    from models import db
+    from models.book import Book
+    from utils.migrations import upgrade_database
+    from utils.seed_data import generate_data
+
+    app = create_app()
+    app.config.update(SQL_QUERY_COUNT_HEADER=True, QUERY_BUDGET_STRICT=False, TESTING=False)
+    with app.app_context():
+        upgrade_database()
+        if not db.session.query(Book.id).first():
+            started = time.perf_counter()
+            generate_data(users=args.users, books=args.books, years=args.years, seed=args.seed,
+                          echo=lambda message: None)
+            print(f'Seeded {args.users} users / {args.books} books in '
+                  f'{time.perf_counter() - started:.1f}s', file=sys.stderr)
+    return app
+
+
+def load_actors(app, clients):
+    from models import db
+    from models.book import Book
+    from models.user import User
+    from models.transaction import Transaction
+
+    with app.app_context():
+        members = db.session.query(User.id, User.username).filter_by(role='member') \
+            .order_by(User.id).limit(clients).all()
+        staff = db.session.query(User.username).filter(User.role.in_(['librarian', 'admin'])) \
+            .order_by(User.id).first()
+        book_ids = [book_id for book_id, in db.session.query(Book.id).order_by(Book.id)]
+        loans = {}
+        for transaction_id, user_id in db.session.query(Transaction.id, Transaction.user_id).filter(
+                Transaction.status == 'borrowed', Transaction.user_id.in_([m.id for m in members])):
+            loans.setdefault(user_id, []).append(transaction_id)
+    if len(members) < clients or staff is None:
+        raise SystemExit('Dataset needs at least one member per client and a librarian')
+    return members, staff.username, book_ids, loans
+
+
+def login(app, username, password):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        raise SystemExit(f'Could not log in as {username}')
+    return client
+
+
+def run(args):
+    from models.transaction import Transaction
+
+    app = prepare_app(args)
+    members, staff_username, book_ids, loans = load_actors(app, args.clients)
+    # A small hot set gets most of the detail and borrow traffic, as in a
+    # real catalogue
+    hot_books = book_ids[:max(1, len(book_ids) // 100)]
+    categories = ['Fiction', 'Science', 'Technology', 'History', 'Computer Science']
+    names, weights = zip(*TRAFFIC_MIX.items())
+
+    samples = {name: [] for name in names}
+    samples_lock = threading.Lock()
+    measuring = threading.Event()
+    stop = threading.Event()
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        member = members[index]
+        client = login(app, member.username, args.password)
+        staff = login(app, staff_username, args.password)
+        open_loans = list(loans.get(member.id, []))
+        local = {name: [] for name in names}
+
+        def pick_book():
+            return rng.choice(hot_books) if rng.random() < 0.5 else rng.choice(book_ids)
+
+        while not stop.is_set():
+            name = rng.choices(names, weights)[0]
+            session = client
+            if name == 'catalog':
+                path = f'/books?category={rng.choice(categories)}&page={rng.randint(1, 5)}'
+            elif name == 'search':
+                path = f'/books?search={rng.choice(SEARCH_TERMS)}'
+            elif name == 'book_details':
+                path = f'/books/{pick_book()}'
+            elif name == 'borrow_book':
+                book_id = pick_book()
+                path = f'/borrow/{book_id}'
+            elif name == 'return_book':
+                if not open_loans:
+                    continue
+                path = f'/return/{open_loans.pop(rng.randrange(len(open_loans)))}'
+            elif name == 'dashboard':
+                path = '/dashboard'
+            else:
+                session = staff
+                path = '/reports'
+
+            started = time.perf_counter()
+            response = session.get(path)
+            latency = time.perf_counter() - started
+
+            if name == 'borrow_book' and response.location and 'dashboard' in response.location:
+                # Bookkeeping for later returns happens outside the timed window
+                with app.app_context():
+                    loan = Transaction.query.filter_by(user_id=member.id, book_id=book_id,
+                                                       status='borrowed').first()
+                if loan:
+                    open_loans.append(loan.id)
+            if measuring.is_set():
+                count = response.headers.get('X-Query-Count')
+                local[name].append((latency, int(count) if count else None,
+                                    response.status_code < 400))
+        with samples_lock:
+            for name, rows in local.items():
+                samples[name].extend(rows)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    measuring.set()
+    started = time.perf_counter()
+    time.sleep(args.seconds)
+    elapsed = time.perf_counter() - started
+    measuring.clear()
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    endpoints = summarize(samples, elapsed)
+    total = sum(result['requests'] for result in endpoints.values())
+    return {
+        'revision': git_revision(),
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'config': {
+            'users': args.users, 'books': args.books, 'years': args.years, 'seed': args.seed,
+            'clients': args.clients, 'seconds': args.seconds,
+            'engine_profile': app.extensions['engine_profile'],
+            'database': 'custom' if args.database_url else 'generated',
+            'mix': TRAFFIC_MIX,
+        },
+        'total': {'requests': total, 'throughput': round(total / elapsed, 2)},
+        'endpoints': endpoints,
+    }
+
+
+def print_report(results):
+    print(f'{"endpoint":<16}{"req":>8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+          f'{"queries":>9}{"errors":>8}')
+    for name, result in results['endpoints'].items():
+        queries = result['queries_mean'] if result['queries_mean'] is not None else '-'
+        print(f'{name:<16}{result["requests"]:>8}{result["throughput"]:>9}{result["p50_ms"]:>9}'
+              f'{result["p95_ms"]:>9}{result["p99_ms"]:>9}{queries:>9}{result["errors"]:>8}')
+    print(f'{"total":<16}{results["total"]["requests"]:>8}{results["total"]["throughput"]:>9}')
+
+
+def compare(results, baseline, threshold):
+    """Print p95/throughput changes against a baseline; return the regressions"""
+    regressions = []
+    print(f'\nAgainst {baseline.get("revision") or "baseline"}:')
+    for name, result in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before or not before['requests'] or not result['requests']:
+            continue
+        p95_change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+        query_change = (result['queries_mean'] or 0) - (before['queries_mean'] or 0)
+        print(f'{name:<16}p95 {p95_change:+.1%}  queries {query_change:+.2f}')
+        # Cache hits make the mean wobble a little between runs
+        if p95_change > threshold or query_change > 0.5:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--password', default='password123')
+    parser.add_argument('--engine-profile', default='sqlite-production')
+    parser.add_argument('--database-url', help='Use an existing database instead of generating one.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--compare', help='Baseline JSON from an earlier run.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed p95 slowdown before --compare fails (default 20%%).')
+    args = parser.parse_args()
+
+    results = run(args)
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f'Regressed: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
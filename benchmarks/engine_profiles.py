@@ -0,0 +1,130 @@
+"""Compare engine profiles under mixed read/write traffic.
+
+    python benchmarks/engine_profiles.py --threads 16 --seconds 10
+
+Each profile runs in its own process against a fresh SQLite file: worker
+threads issue catalog/detail reads and borrow/return writes in the given
+ratio for a fixed time, and the script reports throughput and the number
+of "database is locked" errors per profile.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run_profile(args):
+    os.environ['DB_ENGINE_PROFILE'] = args.profile
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(), 'engine.db')
+
+    from sqlalchemy.exc import OperationalError
+    from app import create_app
+    from models import db
+    from models.book import Book
+    from models.user import User
+    from models.transaction import Transaction
+    from utils.migrations import upgrade_database
+    from utils import circulation
+    from utils.circulation import CirculationError
+
+    app = create_app()
+    with app.app_context():
+        upgrade_database()
+        db.session.add_all(
+            Book(title=f'Engine {i:05d}', author=f'Author {i % 50}', isbn=f'engine-{i}',
+                 category=f'Category {i % 10}', total_copies=3, available_copies=3)
+            for i in range(args.books)
+        )
+        db.session.add_all(
+            User(username=f'engine{i}', email=f'engine{i}@example.com', password_hash='!',
+                 first_name='Engine', last_name=str(i))
+            for i in range(args.users)
+        )
+        db.session.commit()
+
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = {'reads': 0, 'writes': 0, 'locked': 0}
+        while time.perf_counter() < deadline:
+            with app.app_context():
+                try:
+                    if rng.random() < args.write_ratio:
+                        user_id = rng.randint(1, args.users)
+                        loan = Transaction.query.filter_by(user_id=user_id, status='borrowed').first()
+                        try:
+                            if loan and rng.random() < 0.5:
+                                circulation.checkin(loan)
+                            else:
+                                circulation.checkout(user_id, rng.randint(1, args.books))
+                            db.session.commit()
+                        except CirculationError:
+                            db.session.rollback()
+                        local['writes'] += 1
+                    else:
+                        category = f'Category {rng.randint(0, 9)}'
+                        Book.query.filter_by(category=category).order_by(Book.title).limit(12).all()
+                        db.session.get(Book, rng.randint(1, args.books))
+                        local['reads'] += 1
+                except OperationalError:
+                    db.session.rollback()
+                    local['locked'] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    counts['ops_per_second'] = round((counts['reads'] + counts['writes']) / elapsed, 1)
+    counts['profile'] = app.extensions['engine_profile']
+    print(json.dumps(counts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', default='default,sqlite-production')
+    parser.add_argument('--profile', help=argparse.SUPPRESS)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    if args.profile:
+        run_profile(args)
+        return
+
+    print(f'{"profile":<20}{"ops/s":>10}{"reads":>10}{"writes":>10}{"locked":>10}')
+    for profile in args.profiles.split(','):
+        command = [sys.executable, os.path.abspath(__file__), '--profile', profile,
+                   '--threads', str(args.threads), '--seconds', str(args.seconds),
+                   '--write-ratio', str(args.write_ratio), '--books', str(args.books),
+                   '--users', str(args.users)]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{profile:<20}{result["ops_per_second"]:>10}{result["reads"]:>10}'
+              f'{result["writes"]:>10}{result["locked"]:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Measure the fuzzy catalog search on a large synthetic catalog.
+
+    python benchmarks/fuzzy_search.py --books 500000 --queries 500
+
+Fills a fresh SQLite file with generated titles and authors, then reports
+how long building the trigram index, writing its snapshot and loading it
+back take, and the latency of index lookups and of fuzzy_search (lookup
+plus fetching and re-ranking the rows) for queries made by misspelling
+words that occur in the catalog (one letter dropped, doubled or swapped)
+and checking the top result has the words as they were spelled.
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COMMON = ('the', 'of', 'and', 'a', 'in', 'history', 'introduction', 'to', 'guide', 'modern',
+          'physics', 'chemistry', 'art', 'science', 'world', 'life', 'war', 'new', 'theory')
+
+
+def make_vocabulary(rng, size):
+    syllables = [c + v for c in 'bcdfghjklmnprstvwz' for v in 'aeiou'] + ['th', 'ch', 'st', 'ng']
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(vocabulary)
+
+
+def misspell(rng, word):
+    i = rng.randrange(len(word))
+    edit = rng.choice(('drop', 'double', 'swap'))
+    if edit == 'drop' and len(word) > 4:
+        return word[:i] + word[i + 1:]
+    if edit == 'swap' and i < len(word) - 1:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word[:i] + word[i] + word[i:]
+
+
+def fill(app, rng, books, vocabulary, surnames):
+    from models import db
+    from models.book import Book
+
+    rows = []
+    for book_id in range(1, books + 1):
+        title = ' '.join(rng.choice(COMMON) if rng.random() < 0.3 else rng.choice(vocabulary)
+                         for _ in range(rng.randint(2, 6))).title()
+        author = f'{rng.choice(string.ascii_uppercase)}. {rng.choice(surnames).title()}'
+        rows.append({'id': book_id, 'title': title, 'author': author, 'isbn': f'B{book_id:012d}',
+                     'category': rng.choice(('Fiction', 'Science', 'History', 'Art'))})
+    with app.app_context():
+        db.session.execute(Book.__table__.insert(), rows)
+        db.session.commit()
+
+
+def rss_mb():
+    # Current resident size; the peak is already set by filling the catalog
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {'p50': statistics.median(samples), 'p95': samples[int(len(samples) * 0.95)],
+            'max': samples[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=500000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--vocabulary', type=int, default=60000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'fuzzy.db')
+    os.environ['SEARCH_SNAPSHOT'] = os.path.join(workdir, 'search-trigrams.pickle')
+    from app import create_app
+    from models import db
+    from models.book import Book
+    from utils.fuzzy import TrigramIndex, fuzzy_search, _query_terms
+    from utils.migrations import upgrade_database
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    surnames = make_vocabulary(rng, args.vocabulary // 10)
+    app = create_app()
+    with app.app_context():
+        upgrade_database()
+    started = time.perf_counter()
+    fill(app, rng, args.books, vocabulary, surnames)
+    print(f'catalog: {args.books} books in {time.perf_counter() - started:.1f}s')
+
+    with app.app_context():
+        db.session.expire_all()
+        rss = rss_mb()
+        started = time.perf_counter()
+        index = TrigramIndex.build()
+        print(f'build: {time.perf_counter() - started:.2f}s, {len(index)} words, '
+              f'RSS +{rss_mb() - rss:.0f}MB')
+        started = time.perf_counter()
+        index.save(os.environ['SEARCH_SNAPSHOT'])
+        print(f'snapshot: {time.perf_counter() - started:.2f}s, '
+              f'{os.path.getsize(os.environ["SEARCH_SNAPSHOT"]) / 2 ** 20:.0f}MB')
+        started = time.perf_counter()
+        index = TrigramIndex.load(os.environ['SEARCH_SNAPSHOT'])
+        print(f'load: {time.perf_counter() - started:.2f}s')
+        app.extensions['trigram_index'] = index
+
+        titles = db.session.query(Book.title, Book.author).filter(
+            Book.id.in_(rng.sample(range(1, args.books + 1), args.queries))
+        ).all()
+        queries = []
+        for title, author in titles:
+            words = [word for word in _query_terms(f'{title} {author}') if word not in COMMON]
+            picked = rng.sample(words, min(len(words), rng.choice((1, 1, 2))))
+            queries.append((' '.join(misspell(rng, word) for word in picked), set(picked)))
+
+        lookups, searches, found = [], [], 0
+        for query, intended in queries:
+            started = time.perf_counter()
+            index.search(query)
+            lookups.append(time.perf_counter() - started)
+            with app.test_request_context():
+                started = time.perf_counter()
+                results = fuzzy_search(query)
+                searches.append(time.perf_counter() - started)
+            found += bool(results) and intended <= set(_query_terms(f'{results[0].title} {results[0].author}'))
+
+    for name, samples in (('index.search', lookups), ('fuzzy_search', searches)):
+        stats = percentiles(samples)
+        print(f'{name:<14}' + '  '.join(f'{key} {value * 1000:6.2f}ms' for key, value in stats.items()))
+    print(f'top result has the words that were misspelled: {found}/{len(queries)}')
+
+
+if __name__ == '__main__':
+    main()
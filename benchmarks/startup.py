@@ -0,0 +1,120 @@
+"""Measure worker startup: import time, create_app and first requests.
+
+    python benchmarks/startup.py --runs 3
+
+Each mode runs in fresh processes against the same seeded SQLite file:
+  cold       - STARTUP_MODE=default, templates compiled on first use
+  bytecode   - templates loaded from a precompiled bytecode cache
+  production - bytecode cache plus warmup() right after create_app, as
+               post_worker_init runs it in a forked worker, signed in as
+               the seeded admin (user50)
+The script reports the median of each timing over the runs, including
+the first and second hit of /books, /dashboard and /reports.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PATHS = ('/books', '/dashboard', '/reports')
+MODES = {
+    'cold': {'STARTUP_MODE': 'default'},
+    'bytecode': {'STARTUP_MODE': 'default'},
+    'production': {'STARTUP_MODE': 'production', 'WARMUP_USER': 'user50'},
+}
+
+
+def setup(database_url, cache_dir):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['TEMPLATE_CACHE_DIR'] = cache_dir
+    from app import create_app
+    from utils.migrations import upgrade_database
+    from utils.seed_data import create_dummy_data
+    from utils.startup import precompile_templates
+
+    app = create_app()
+    with app.app_context():
+        upgrade_database()
+        create_dummy_data()
+    precompile_templates(app)
+
+
+def measure():
+    started = time.perf_counter()
+    from app import create_app
+    from models.user import User
+    from utils.startup import warmup
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+    if app.extensions['startup_mode'] == 'production':
+        warmup(app)
+    warmed = time.perf_counter()
+
+    with app.app_context():
+        librarian_id = User.query.filter_by(role='librarian').first().id
+    client = app.test_client()
+    # Log in through the session so no request runs before the measured ones
+    with client.session_transaction() as session:
+        session['_user_id'] = str(librarian_id)
+        session['_fresh'] = True
+
+    result = {'import': imported - started, 'create_app': created - imported, 'warmup': warmed - created}
+    for path in PATHS:
+        for hit in ('first', 'second'):
+            before = time.perf_counter()
+            response = client.get(path)
+            result[f'{path} {hit}'] = time.perf_counter() - before
+            assert response.status_code == 200, (path, response.status_code)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--setup', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure()
+        return
+    if args.setup:
+        setup(os.environ['DATABASE_URL'], os.environ['TEMPLATE_CACHE_DIR'])
+        return
+
+    workdir = tempfile.mkdtemp()
+    cache_dir = os.path.join(workdir, 'jinja-cache')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'startup.db'),
+               TEMPLATE_CACHE_DIR=cache_dir)
+    script = os.path.abspath(__file__)
+    subprocess.run([sys.executable, script, '--setup'], env=env, check=True, capture_output=True)
+
+    results = {}
+    for mode in args.modes.split(','):
+        mode_env = dict(env, **MODES[mode])
+        if mode == 'cold':
+            mode_env.pop('TEMPLATE_CACHE_DIR')
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run([sys.executable, script, '--measure'], env=mode_env,
+                                    capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results[mode] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+    modes = list(results)
+    print(f'{"ms":<20}' + ''.join(f'{mode:>12}' for mode in modes))
+    for key in results[modes[0]]:
+        print(f'{key:<20}' + ''.join(f'{results[mode][key] * 1000:>12.1f}' for mode in modes))
+
+
+if __name__ == '__main__':
+    main()
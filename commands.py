@@ -0,0 +1,198 @@
+import time
+import click
+from utils.search import rebuild_search_index
+from utils.fuzzy import TrigramIndex, snapshot_path
+from utils.migrations import upgrade_database
+from utils.query_plans import find_full_scans
+from utils.stats import reconcile_stats
+from utils.importer import IMPORT_FORMATS, detect_format, import_books
+from utils.seed_data import generate_data
+from utils.fines import accrue_overdue_fines
+from utils.notifications import deliver_pending, queue_due_reminders, run_workers
+from utils.archive import archive_transactions
+from utils.inventory import reconcile_inventory
+from utils.startup import precompile_templates, warmup
+from utils.recommendations import build_recommendations
+from utils.exports import EXPORTS, EXPORT_FORMATS, stream_export
+
+
+def register_commands(app):
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Create and repopulate the full-text catalog search index."""
+        if rebuild_search_index():
+            click.echo('Search index rebuilt.')
+        else:
+            click.echo('Full-text search is only available on SQLite; using ILIKE search.')
+    
+    @app.cli.command('snapshot-fuzzy-index')
+    def snapshot_fuzzy_index_command():
+        """Write the fuzzy search trigram index to SEARCH_SNAPSHOT for workers to load."""
+        started = time.perf_counter()
+        index = TrigramIndex.build(app.config.get('SEARCH_FUZZY_THRESHOLD', 0.3))
+        path = snapshot_path(app)
+        index.save(path)
+        click.echo(f'{len(index)} words indexed into {path} in {time.perf_counter() - started:.1f}s')
+    
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Create missing tables, indexes and the search index."""
+        created = upgrade_database()
+        for name in created:
+            click.echo(f'Created index {name}')
+        click.echo('Database is up to date.')
+    
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Fail if any hot route query needs a full table scan."""
+        offenders = find_full_scans()
+        for name, scans in offenders.items():
+            click.echo(f'{name}: {"; ".join(scans)}', err=True)
+        if offenders:
+            raise SystemExit(1)
+        click.echo('No full table scans in route queries.')
+    
+    @app.cli.command('precompile-templates')
+    def precompile_templates_command():
+        """Fill the template bytecode cache, e.g. while building a release."""
+        if app.jinja_env.bytecode_cache is None:
+            raise click.UsageError('No bytecode cache configured; set TEMPLATE_CACHE_DIR or STARTUP_MODE=production.')
+        started = time.perf_counter()
+        names = precompile_templates(app)
+        click.echo(f'{len(names)} templates compiled in {time.perf_counter() - started:.2f}s')
+    
+    @app.cli.command('warmup')
+    def warmup_command():
+        """Run the worker warmup and print how long each phase took."""
+        for name, seconds in warmup(app).items():
+            click.echo(f'{name}: {seconds * 1000:.1f}ms')
+    
+    @app.cli.command('reconcile-stats')
+    def reconcile_stats_command():
+        """Rebuild the /reports counters from the source tables."""
+        totals = reconcile_stats()
+        for name, (count, amount) in totals.items():
+            click.echo(f'{name}: {count}' + (f' (£{amount:.2f})' if amount else ''))
+    
+    @app.cli.command('import-books')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS),
+                  help='Defaults to the file extension (.csv, .jsonl, .mrk).')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def import_books_command(path, fmt, batch_size):
+        """Bulk upsert books by ISBN from a CSV, JSONL or MARC-lite file."""
+        fmt = fmt or detect_format(path)
+        if fmt is None:
+            raise click.UsageError('Cannot tell the file format from its extension; pass --format.')
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            report = import_books(stream, fmt, batch_size=batch_size)
+        for line, message in report.errors:
+            click.echo(f'line {line}: {message}', err=True)
+        click.echo(f'{report.rows} rows: {report.inserted} inserted, {report.updated} updated, '
+                   f'{report.duplicates} duplicates, {report.failed} rejected in {report.elapsed:.1f}s '
+                   f'({report.rows_per_second:.0f} rows/s)')
+    
+    @app.cli.command('seed')
+    @click.option('--users', default=50, show_default=True)
+    @click.option('--books', default=100, show_default=True)
+    @click.option('--years', default=1.0, show_default=True, help='Years of loan history.')
+    @click.option('--transactions', type=int, help='Defaults to 10 loans per member per year.')
+    @click.option('--seed', 'rng_seed', default=42, show_default=True)
+    @click.option('--batch-size', default=10000, show_default=True)
+    def seed_command(users, books, years, transactions, rng_seed, batch_size):
+        """Generate a reproducible synthetic dataset of the given scale."""
+        upgrade_database()
+        started = time.perf_counter()
+        generate_data(users=users, books=books, years=years, transactions=transactions,
+                      seed=rng_seed, batch_size=batch_size, echo=click.echo)
+        click.echo(f'Done in {time.perf_counter() - started:.1f}s')
+    
+    @app.cli.command('accrue-fines')
+    @click.option('--chunk-size', default=50000, show_default=True)
+    @click.option('--full', is_flag=True, help='Recompute every overdue loan, not just those changed since the last run.')
+    def accrue_fines_command(chunk_size, full):
+        """Create or update fines for loans still out past their due date (run nightly)."""
+        started = time.perf_counter()
+        written = accrue_overdue_fines(chunk_size=chunk_size, full=full)
+        click.echo(f'{written} fines written in {time.perf_counter() - started:.1f}s')
+    
+    @app.cli.command('archive-transactions')
+    @click.option('--older-than', 'older_than_days', type=int,
+                  help='Days since return; defaults to ARCHIVE_AFTER_DAYS.')
+    @click.option('--batch-size', default=10000, show_default=True)
+    def archive_transactions_command(older_than_days, batch_size):
+        """Move old returned loans and their paid fines to the history tables."""
+        started = time.perf_counter()
+        archived = archive_transactions(older_than_days, batch_size=batch_size)
+        click.echo(f'{archived} loans archived in {time.perf_counter() - started:.1f}s')
+    
+    @app.cli.command('reconcile-inventory')
+    @click.option('--dry-run', is_flag=True, help='Report drift without repairing it; exits 1 if there is any.')
+    @click.option('--chunk-size', default=5000, show_default=True, help='Books checked per query and commit.')
+    def reconcile_inventory_command(dry_run, chunk_size):
+        """Check available copies and status against total copies minus open loans."""
+        started = time.perf_counter()
+        report = reconcile_inventory(repair=not dry_run, chunk_size=chunk_size)
+        for book_id, available, expected, status, new_status in report.samples:
+            click.echo(f'book {book_id}: {available} available, expected {expected}'
+                       + (f'; status {status} -> {new_status}' if status != new_status else ''))
+        click.echo(f'{report.checked} books checked in {time.perf_counter() - started:.1f}s: '
+                   f'{report.drifted} drifted ({report.oversubscribed} with more loans than copies), '
+                   f'{report.repaired} repaired, {report.skipped} changed meanwhile')
+        if dry_run and report.drifted:
+            raise SystemExit(1)
+    
+    @app.cli.command('build-recommendations')
+    @click.option('--full', is_flag=True, help='Rescore every book, not just those touched since the last run.')
+    @click.option('--top-n', type=int, help='Defaults to RECOMMENDATIONS_TOP_N.')
+    @click.option('--batch-size', default=256, show_default=True, help='Books scored per matrix product.')
+    def build_recommendations_command(full, top_n, batch_size):
+        """Rebuild the "readers also borrowed" lists from the loan history (run nightly)."""
+        started = time.perf_counter()
+        refreshed = build_recommendations(full=full, top_n=top_n, batch_size=batch_size)
+        click.echo(f'{refreshed} books refreshed in {time.perf_counter() - started:.1f}s')
+    
+    @app.cli.command('queue-reminders')
+    @click.option('--days', type=int, help='Remind about loans due within this many days.')
+    def queue_reminders_command(days):
+        """Queue one due-date reminder per member with loans due soon (run daily)."""
+        click.echo(f'{queue_due_reminders(days_ahead=days)} members queued')
+    
+    @app.cli.command('notifications-worker')
+    @click.option('--workers', default=2, show_default=True)
+    @click.option('--batch-size', default=100, show_default=True)
+    @click.option('--interval', default=5.0, show_default=True, help='Seconds to sleep when the outbox is empty.')
+    @click.option('--once', is_flag=True, help='Send what is due now and exit.')
+    def notifications_worker_command(workers, batch_size, interval, once):
+        """Deliver queued notifications from a pool of worker threads."""
+        if once:
+            total = 0
+            while True:
+                sent = deliver_pending(batch_size)
+                if not sent:
+                    break
+                total += sent
+            click.echo(f'{total} notifications sent')
+            return
+        threads, stop = run_workers(app, workers, batch_size, interval)
+        click.echo(f'{workers} notification workers running, Ctrl+C to stop')
+        try:
+            while any(thread.is_alive() for thread in threads):
+                threads[0].join(1)
+        except KeyboardInterrupt:
+            stop.set()
+    
+    @app.cli.command('export')
+    @click.argument('name', type=click.Choice(EXPORTS))
+    @click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='csv', show_default=True)
+    @click.option('--start', type=click.DateTime(['%Y-%m-%d']), help='First day to include.')
+    @click.option('--end', type=click.DateTime(['%Y-%m-%d']), help='Day to stop before.')
+    @click.option('--output', '-o', type=click.Path(dir_okay=False), help='Defaults to stdout.')
+    @click.option('--chunk-size', type=int, help='Rows per chunk; defaults to EXPORT_CHUNK_SIZE.')
+    def export_command(name, fmt, start, end, output, chunk_size):
+        """Stream transactions, fines or overdue loans to CSV or Parquet."""
+        chunks = stream_export(name, fmt, start, end, chunk_size or app.config['EXPORT_CHUNK_SIZE'])
+        binary = fmt == 'parquet'
+        with click.open_file(output or '-', 'wb' if binary else 'w', encoding=None if binary else 'utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
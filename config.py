@@ -3,4 +3,141 @@ import os
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'library-management-secret-key'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///library.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # Engine tuning: 'default', 'sqlite-production', 'postgresql' or 'auto'
+    # (see utils/engine.py)
+    DB_ENGINE_PROFILE = os.environ.get('DB_ENGINE_PROFILE') or 'default'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB') or 64 * 1024)
+    PG_STATEMENT_TIMEOUT_MS = int(os.environ.get('PG_STATEMENT_TIMEOUT_MS') or 30000)
+    
+    # Read replicas (comma-separated URLs). Endpoints in REPLICA_ENDPOINTS read
+    # from a replica lagging at most REPLICA_MAX_LAG_SECONDS behind; a client
+    # that wrote within that window reads from the primary instead. Cache
+    # fills always read from the primary, so cached pages aren't behind.
+    DATABASE_REPLICA_URLS = [url.strip() for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url.strip()]
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS') or 5)
+    REPLICA_CHECK_INTERVAL_SECONDS = 5
+    REPLICA_ENDPOINTS = {
+        'books.book_catalog',
+        'books.book_details',
+        'member.borrowing_history',
+        'admin.generate_reports',
+        'admin.export_report',
+        'api.list_books',
+        'api.get_book',
+    }
+    
+    # Worker startup: 'default' or 'production', which keeps compiled templates
+    # in TEMPLATE_CACHE_DIR (instance/jinja-cache unless set; fill it at build
+    # time with `flask precompile-templates`) and warms each worker up after
+    # the fork (utils.startup.post_worker_init)
+    STARTUP_MODE = os.environ.get('STARTUP_MODE') or 'default'
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+    WARMUP_POOL_CONNECTIONS = int(os.environ.get('WARMUP_POOL_CONNECTIONS') or 2)
+    WARMUP_TEMPLATES = (
+        'base.html',
+        'macros/pagination.html',
+        'index.html',
+        'auth/login.html',
+        'books/catalog.html',
+        'books/_catalog_results.html',
+        'books/book_detail.html',
+        'members/dashboard.html',
+        'admin/reports.html',
+    )
+    # Requested during warmup; pages behind the login only get past the
+    # redirect when WARMUP_USER names an account allowed to see them
+    WARMUP_PATHS = ('/', '/books', '/dashboard', '/reports')
+    WARMUP_USER = os.environ.get('WARMUP_USER')
+    
+    # Catalog searches the exact path finds nothing for fall back to ranked
+    # trigram matches on title and author. Each worker holds the index in
+    # memory, loaded from SEARCH_SNAPSHOT (instance/search-trigrams.pickle
+    # unless set; write it with `flask snapshot-fuzzy-index`) or built on
+    # first use. Books added elsewhere are indexed SEARCH_FUZZY_SYNC_BATCH
+    # per search; edits made in another worker only show up after a restart
+    SEARCH_FUZZY = os.environ.get('SEARCH_FUZZY', '1') != '0'
+    SEARCH_FUZZY_THRESHOLD = 0.3
+    SEARCH_FUZZY_CANDIDATES = 100
+    SEARCH_FUZZY_SYNC_BATCH = 1000
+    SEARCH_SNAPSHOT = os.environ.get('SEARCH_SNAPSHOT')
+    
+    # 'offset' (numbered pages) or 'keyset' (cursor tokens, constant cost per page)
+    PAGINATION_MODE = os.environ.get('PAGINATION_MODE') or 'offset'
+    
+    # Maximum SQL statements per endpoint; exceeding one is logged, or raises
+    # with QUERY_BUDGET_STRICT / TESTING so N+1 regressions fail the build
+    QUERY_BUDGETS = {
+        # One more than the plain listing for the fuzzy search fallback
+        'books.book_catalog': 5,
+        # One more on a cache miss for the "readers also borrowed" list
+        'books.book_details': 5,
+        'member.dashboard': 6,
+        'member.borrowing_history': 4,
+        'member.manage_members': 4,
+        'admin.generate_reports': 12,
+        'transaction.view_reservations': 3,
+        'transaction.view_fines': 3,
+        'api.list_books': 2,
+        'api.get_book': 3,
+    }
+    QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT') == '1'
+    SQL_QUERY_COUNT_HEADER = os.environ.get('SQL_QUERY_COUNT_HEADER') == '1'
+    
+    # Read-through cache for catalog pages, categories and book details:
+    # 'lru' (per process), 'redis' (shared, needs CACHE_REDIS_URL) or 'null'
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'lru'
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL') or 60)
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES') or 2048)
+    # Snapshots of logged-in users for the Flask-Login user_loader (0 disables)
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL') or 300)
+    IDENTITY_CACHE_MAX_ENTRIES = int(os.environ.get('IDENTITY_CACHE_MAX_ENTRIES') or 10000)
+    
+    # Password hashing: full Werkzeug method string (hashes made with other
+    # parameters are upgraded at the next login), executor 'thread',
+    # 'process' or 'inline', and how many hashes may run / wait at once
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR') or 'thread'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or max(1, (os.cpu_count() or 2) // 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING') or 32)
+    PASSWORD_HASH_WAIT_SECONDS = float(os.environ.get('PASSWORD_HASH_WAIT_SECONDS') or 5)
+    
+    # Exports stream this many rows per CSV chunk / Parquet row group; the
+    # reports page lists only the first REPORT_OVERDUE_LIMIT overdue loans
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE') or 5000)
+    REPORT_OVERDUE_LIMIT = 50
+    
+    # `flask archive-transactions` moves returned loans (and their paid
+    # fines) older than this into the history tables
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS') or 365)
+    
+    # Leaderboard windows (days) offered on /reports besides all time
+    LEADERBOARD_WINDOWS = (7, 30, 365)
+    
+    # "Readers also borrowed" lists built by `flask build-recommendations`
+    # (needs numpy and scipy): list length, and readers two books must share
+    RECOMMENDATIONS_TOP_N = 6
+    RECOMMENDATIONS_MIN_COMMON = 2
+    
+    # Circulation rules
+    LOAN_PERIOD_DAYS = 14
+    FINE_PER_DAY = 0.50
+    
+    # Notification outbox: 'file' (JSON lines under instance/), 'smtp', 'null'
+    # or a 'module:Class' transport; drained by `flask notifications-worker`
+    NOTIFICATION_TRANSPORT = os.environ.get('NOTIFICATION_TRANSPORT') or 'file'
+    NOTIFICATION_FILE = os.environ.get('NOTIFICATION_FILE')
+    NOTIFICATION_SENDER = os.environ.get('NOTIFICATION_SENDER') or 'library@localhost'
+    NOTIFICATION_MAX_ATTEMPTS = 5
+    NOTIFICATION_LEASE_SECONDS = 300
+    DUE_REMINDER_DAYS = 2
+    SMTP_HOST = os.environ.get('SMTP_HOST') or 'localhost'
+    SMTP_PORT = int(os.environ.get('SMTP_PORT') or 25)
+    SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
+    SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+    SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS') == '1'
@@ -1,3 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
+from utils.replicas import RoutingSession
 
-db = SQLAlchemy()
\ No newline at end of file
+# RoutingSession sends read-only endpoints' SELECTs to replicas, if any are
+# configured (see utils/replicas.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
\ No newline at end of file
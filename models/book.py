@@ -3,6 +3,10 @@ from datetime import datetime
 
 class Book(db.Model):
     __tablename__ = 'books'
+    __table_args__ = (
+        db.Index('ix_books_title', 'title'),
+        db.Index('ix_books_category_title', 'category', 'title'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -17,6 +21,9 @@ class Book(db.Model):
     description = db.Column(db.Text)
     status = db.Column(db.String(20), default='available')
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every write to the row (circulation, edits, imports,
+    # reservations); the JSON API derives its ETags from it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Relationships
     transactions = db.relationship('Transaction', backref='book', lazy=True)
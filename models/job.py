@@ -0,0 +1,11 @@
+from . import db
+
+class JobRun(db.Model):
+    __tablename__ = 'job_runs'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    last_run_at = db.Column(db.DateTime)
+    rows_affected = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<JobRun {self.name} at {self.last_run_at}>'
@@ -0,0 +1,27 @@
+from . import db
+from datetime import datetime
+
+class Notification(db.Model):
+    """Outbox row: written in the same commit as the event, delivered later"""
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)
+    # Enqueueing the same key twice is a no-op
+    dedup_key = db.Column(db.String(100), unique=True, nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    
+    user = db.relationship('User')
+    
+    def __repr__(self):
+        return f'<Notification {self.kind} User:{self.user_id} {self.status}>'
@@ -0,0 +1,14 @@
+from . import db
+
+class BookRecommendation(db.Model):
+    """Precomputed "readers also borrowed" list, one row per (book, rank)"""
+    __tablename__ = 'book_recommendations'
+    __table_args__ = {'sqlite_with_rowid': False}
+    
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    recommended_book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    
+    def __repr__(self):
+        return f'<BookRecommendation Book:{self.book_id} #{self.rank} -> {self.recommended_book_id}>'
@@ -0,0 +1,55 @@
+from . import db
+
+class LibraryCounter(db.Model):
+    __tablename__ = 'library_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<LibraryCounter {self.name}={self.count}>'
+
+class BookStat(db.Model):
+    __tablename__ = 'book_stats'
+    
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    borrow_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    
+    def __repr__(self):
+        return f'<BookStat Book:{self.book_id} Borrows:{self.borrow_count}>'
+
+class UserStat(db.Model):
+    __tablename__ = 'user_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    borrow_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    
+    def __repr__(self):
+        return f'<UserStat User:{self.user_id} Borrows:{self.borrow_count}>'
+
+# Borrows per book and per member per day, for leaderboards over recent
+# windows; stored clustered by day so a window is one contiguous range
+class BookDailyStat(db.Model):
+    __tablename__ = 'book_daily_stats'
+    __table_args__ = {'sqlite_with_rowid': False}
+    
+    day = db.Column(db.Date, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    borrow_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<BookDailyStat {self.day} Book:{self.book_id} Borrows:{self.borrow_count}>'
+
+class UserDailyStat(db.Model):
+    __tablename__ = 'user_daily_stats'
+    __table_args__ = {'sqlite_with_rowid': False}
+    
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    # The book's category at the time of the borrow
+    category = db.Column(db.String(50), primary_key=True)
+    borrow_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<UserDailyStat {self.day} User:{self.user_id} {self.category}:{self.borrow_count}>'
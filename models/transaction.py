@@ -1,8 +1,19 @@
 from . import db
+from sqlalchemy import literal, select, union_all
 from datetime import datetime, timedelta
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('ix_transactions_user_status', 'user_id', 'status'),
+        db.Index('ix_transactions_user_borrow_date', 'user_id', 'borrow_date'),
+        db.Index('ix_transactions_status_due_date', 'status', 'due_date'),
+        db.Index('ix_transactions_book_status', 'book_id', 'status'),
+        # A member can hold at most one open loan of the same book
+        db.Index('ux_transactions_open_loan', 'user_id', 'book_id', unique=True,
+                 sqlite_where=db.text("status = 'borrowed'"),
+                 postgresql_where=db.text("status = 'borrowed'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -18,6 +29,10 @@ class Transaction(db.Model):
 
 class Reservation(db.Model):
     __tablename__ = 'reservations'
+    __table_args__ = (
+        db.Index('ix_reservations_book_status', 'book_id', 'status'),
+        db.Index('ix_reservations_user_status', 'user_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -31,6 +46,16 @@ class Reservation(db.Model):
 
 class Fine(db.Model):
     __tablename__ = 'fines'
+    __table_args__ = (
+        db.Index('ix_fines_user_status', 'user_id', 'status'),
+        db.Index('ix_fines_status', 'status'),
+        db.Index('ix_fines_transaction_id', 'transaction_id'),
+        # One unpaid overdue fine per loan, which the accrual job updates in
+        # place; once it is paid, days still to come go into a new one
+        db.Index('ux_fines_overdue_unpaid', 'transaction_id', unique=True,
+                 sqlite_where=db.text("reason = 'overdue' AND status = 'unpaid'"),
+                 postgresql_where=db.text("reason = 'overdue' AND status = 'unpaid'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -44,4 +69,59 @@ class Fine(db.Model):
     transaction = db.relationship('Transaction', backref='fine')
     
     def __repr__(self):
-        return f'<Fine User:{self.user_id} Amount:{self.amount}>'
\ No newline at end of file
+        return f'<Fine User:{self.user_id} Amount:{self.amount}>'
+
+# Archived rows: returned loans and their paid fines older than
+# ARCHIVE_AFTER_DAYS, moved out of the live tables by utils.archive with
+# their ids unchanged, so the hot tables hold open loans and recent history
+class TransactionHistory(db.Model):
+    __tablename__ = 'transactions_history'
+    __table_args__ = (
+        db.Index('ix_transactions_history_user_borrow_date', 'user_id', 'borrow_date'),
+        db.Index('ix_transactions_history_book_id', 'book_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    borrow_date = db.Column(db.DateTime)
+    due_date = db.Column(db.DateTime, nullable=False)
+    return_date = db.Column(db.DateTime)
+    status = db.Column(db.String(20))
+    renewal_count = db.Column(db.Integer)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FineHistory(db.Model):
+    __tablename__ = 'fines_history'
+    __table_args__ = (
+        db.Index('ix_fines_history_user_issue_date', 'user_id', 'issue_date'),
+        db.Index('ix_fines_history_transaction_id', 'transaction_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    transaction_id = db.Column(db.Integer, nullable=False)
+    amount = db.Column(db.Float)
+    reason = db.Column(db.String(100))
+    issue_date = db.Column(db.DateTime)
+    paid_date = db.Column(db.DateTime)
+    status = db.Column(db.String(20))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def _live_and_archived(live, archived, name):
+    columns = [column.name for column in live.__table__.columns]
+    return union_all(
+        select(*[live.__table__.c[c] for c in columns], literal(False).label('archived')),
+        select(*[archived.__table__.c[c] for c in columns], literal(True).label('archived')),
+    ).subquery(name)
+
+class LoanRecord(db.Model):
+    """Read-only view of every loan, live or archived, for history and reports"""
+    __table__ = _live_and_archived(Transaction, TransactionHistory, 'loan_records')
+    
+    book = db.relationship('Book', primaryjoin='foreign(LoanRecord.book_id) == Book.id', viewonly=True)
+    user = db.relationship('User', primaryjoin='foreign(LoanRecord.user_id) == User.id', viewonly=True)
+
+class FineRecord(db.Model):
+    """Read-only view of every fine, live or archived"""
+    __table__ = _live_and_archived(Fine, FineHistory, 'fine_records')
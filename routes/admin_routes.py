@@ -1,14 +1,24 @@
-from flask import Blueprint, render_template, request, flash
+from flask import Blueprint, Response, abort, current_app, render_template, request, flash, redirect, stream_with_context, url_for
 from flask_login import login_required, current_user
-from models import db
-from models.user import User
-from models.book import Book
-from models.transaction import Transaction, Fine
-from datetime import datetime, timedelta
-from sqlalchemy import func
+from models.transaction import Transaction
+from datetime import datetime
+from sqlalchemy.orm import joinedload
+from utils import stats
+from utils.cache import cache
+from utils.exports import EXPORTS, EXPORT_FORMATS, stream_export
+from utils.identity import identity_cache
+from routes.book_routes import cached_categories
 
 admin_bp = Blueprint('admin', __name__)
 
+
+def overdue_loans_query(now):
+    return Transaction.query.filter(
+        Transaction.status == 'borrowed',
+        Transaction.due_date < now
+    ).order_by(Transaction.due_date)
+
+
 @admin_bp.route('/reports')
 @login_required
 def generate_reports():
@@ -16,35 +26,33 @@ def generate_reports():
         flash('Access denied. Librarian role required.', 'error')
         return redirect(url_for('index'))
     
+    counters = stats.get_counters()
+    total_books = counters['books'].count
+    total_members = counters['members'].count
+    total_borrowed = counters['borrowed'].count
+    now = datetime.utcnow()
+    total_overdue = overdue_loans_query(now).count()
+    total_fines = counters['unpaid_fines'].count
+    total_fine_amount = counters['unpaid_fines'].amount
     
-    total_books = Book.query.count()
-    total_members = User.query.filter_by(role='member').count()
-    total_borrowed = Transaction.query.filter_by(status='borrowed').count()
-    total_overdue = Transaction.query.filter(
-        Transaction.status == 'borrowed',
-        Transaction.due_date < datetime.utcnow()
-    ).count()
-    total_fines = Fine.query.filter_by(status='unpaid').count()
-    total_fine_amount = db.session.query(func.sum(Fine.amount)).filter_by(status='unpaid').scalar() or 0
-    
-    popular_books = db.session.query(
-        Book, 
-        func.count(Transaction.id).label('borrow_count')
-    ).join(Transaction).group_by(Book.id).order_by(
-        func.count(Transaction.id).desc()
-    ).limit(10).all()
+    # Leaderboards: all time, or the last N days from the daily buckets
+    windows = current_app.config.get('LEADERBOARD_WINDOWS', (7, 30, 365))
+    window = request.args.get('window', type=int)
+    if window not in windows:
+        window = None
+    categories = cached_categories()
+    category = request.args.get('category', '')
+    if category not in categories:
+        category = ''
+    popular_books = stats.popular_books(10, window, category)
+    active_members = stats.active_members(10, window, category)
     
-    active_members = db.session.query(
-        User,
-        func.count(Transaction.id).label('borrow_count')
-    ).join(Transaction).group_by(User.id).order_by(
-        func.count(Transaction.id).desc()
-    ).limit(10).all()
-    
-    overdue_books = Transaction.query.filter(
-        Transaction.status == 'borrowed',
-        Transaction.due_date < datetime.utcnow()
-    ).all()
+    # The full list can run to hundreds of thousands of rows; it is
+    # available through the overdue export instead
+    overdue_books = overdue_loans_query(now).options(
+        joinedload(Transaction.book),
+        joinedload(Transaction.user)
+    ).limit(current_app.config.get('REPORT_OVERDUE_LIMIT', 50)).all()
     
     return render_template('admin/reports.html',
                          total_books=total_books,
@@ -55,7 +63,40 @@ def generate_reports():
                          total_fine_amount=total_fine_amount,
                          popular_books=popular_books,
                          active_members=active_members,
-                         overdue_books=overdue_books)
+                         windows=windows,
+                         window=window,
+                         categories=categories,
+                         category=category,
+                         overdue_books=overdue_books,
+                         now=now)
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        abort(400, f'Invalid date {value!r}, expected YYYY-MM-DD')
+
+@admin_bp.route('/reports/export/<name>')
+@login_required
+def export_report(name):
+    """Stream a full export as CSV or Parquet; ?start/?end are YYYY-MM-DD, end exclusive"""
+    if current_user.role not in ['librarian', 'admin']:
+        flash('Access denied. Librarian role required.', 'error')
+        return redirect(url_for('index'))
+    
+    fmt = request.args.get('format', 'csv')
+    if name not in EXPORTS or fmt not in EXPORT_FORMATS:
+        abort(404)
+    start = _parse_date(request.args.get('start'))
+    end = _parse_date(request.args.get('end'))
+    
+    chunks = stream_export(name, fmt, start, end, current_app.config.get('EXPORT_CHUNK_SIZE', 5000))
+    filename = f"{name}-{datetime.utcnow():%Y%m%d}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/vnd.apache.parquet'
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 @admin_bp.route('/system-config')
 @login_required
@@ -64,4 +105,9 @@ def system_config():
         flash('Access denied. Admin role required.', 'error')
         return redirect(url_for('index'))
     
-    return render_template('admin/system_config.html')
\ No newline at end of file
+    counters = stats.get_counters()
+    caches = [('Content cache', cache), ('Identity cache', identity_cache)]
+    return render_template('admin/system_config.html',
+                         total_books=counters['books'].count,
+                         total_members=counters['members'].count,
+                         caches=caches)
\ No newline at end of file
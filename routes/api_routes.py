@@ -0,0 +1,119 @@
+import hashlib
+import json
+from datetime import datetime
+from flask import Blueprint, current_app, request
+from models import db
+from models.book import Book
+from routes.book_routes import load_book_details
+from utils.cache import cache
+from utils.pagination import keyset_paginate
+from utils.search import search_books
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+BOOK_FIELDS = ('id', 'title', 'author', 'isbn', 'category', 'publisher', 'publication_year',
+               'total_copies', 'available_copies', 'location', 'description', 'status',
+               'version', 'reservation_count')
+# What a catalog listing returns unless ?fields= asks for something else
+LIST_FIELDS = ('id', 'title', 'author', 'category', 'available_copies', 'status', 'version')
+LIST_ONLY_FIELDS = set(BOOK_FIELDS) - {'reservation_count'}
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@api_bp.errorhandler(APIError)
+def handle_api_error(error):
+    return _json({'error': str(error)}, error.status)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serialisable')
+
+
+def _json(payload, status=200):
+    body = json.dumps(payload, separators=(',', ':'), default=_default)
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def _fields(default, allowed):
+    requested = request.args.get('fields')
+    if not requested:
+        return default
+    fields = tuple(dict.fromkeys(field.strip() for field in requested.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise APIError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def _conditional(etag, build):
+    """Answer 304 if the client already has ``etag``, otherwise build the body"""
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    # Clients may keep the body but must revalidate before using it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@api_bp.route('/books')
+def list_books():
+    """Catalog listing with keyset pagination.
+
+    The page is first resolved to (id, version) pairs only; the ETag comes
+    from those, so a client whose copy is current gets a 304 without the
+    full rows ever being loaded. Cursors need a stable key, so search
+    results are listed by title, not by relevance as on the catalog page.
+    """
+    fields = _fields(LIST_FIELDS, LIST_ONLY_FIELDS)
+    category = request.args.get('category', '')
+    search = request.args.get('search', '')
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+
+    query = db.session.query(Book.id, Book.title, Book.version)
+    if category:
+        query = query.filter(Book.category == category)
+    if search:
+        query = search_books(query, search)
+    page = keyset_paginate(query, (Book.title, Book.id), request.args.get('cursor'), per_page)
+
+    key = json.dumps([fields, [(row.id, row.version) for row in page.items],
+                      page.next_cursor, page.prev_cursor], separators=(',', ':'))
+    etag = 'books-' + hashlib.sha1(key.encode()).hexdigest()
+
+    def build():
+        ids = [row.id for row in page.items]
+        books = {book.id: book for book in Book.query.filter(Book.id.in_(ids))} if ids else {}
+        items = [{field: getattr(books[book_id], field) for field in fields}
+                 for book_id in ids if book_id in books]
+        return _json({'items': items, 'next_cursor': page.next_cursor,
+                      'prev_cursor': page.prev_cursor})
+
+    return _conditional(etag, build)
+
+
+@api_bp.route('/books/<int:book_id>')
+def get_book(book_id):
+    fields = _fields(BOOK_FIELDS, BOOK_FIELDS)
+    version = db.session.query(Book.version).filter(Book.id == book_id).scalar()
+    if version is None:
+        raise APIError('Book not found', 404)
+
+    signature = hashlib.sha1(','.join(fields).encode()).hexdigest()[:8]
+    etag = f'book-{book_id}-{version}-{signature}'
+
+    def build():
+        details = cache.get_or_set(f'book:{book_id}', 'details', lambda: load_book_details(book_id))
+        if details is None or details['version'] != version:
+            details = load_book_details(book_id)
+        return _json({field: details[field] for field in fields})
+
+    return _conditional(etag, build)
@@ -2,10 +2,16 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db
 from models.user import User
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils import stats
+from utils import passwords
+from utils.passwords import HashingBusy
 
 auth_bp = Blueprint('auth', __name__)
 
+def _hashing_busy(template):
+    flash('The library is very busy right now. Please try again in a moment.', 'warning')
+    return render_template(template), 503, {'Retry-After': '5'}
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -17,7 +23,20 @@ def login():
         
         user = User.query.filter_by(username=username).first()
         
-        if user and check_password_hash(user.password_hash, password):
+        try:
+            valid = user is not None and passwords.verify_password(user.password_hash, password)
+        except HashingBusy:
+            return _hashing_busy('auth/login.html')
+        
+        if valid:
+            if passwords.needs_rehash(user.password_hash):
+                # Upgrade to the configured cost now that we know the password,
+                # unless that would mean waiting for a slot
+                try:
+                    user.password_hash = passwords.hash_password(password, wait=0)
+                    db.session.commit()
+                except HashingBusy:
+                    pass
             login_user(user)
             flash('Login successful!', 'success')
             next_page = request.args.get('next')
@@ -44,15 +63,20 @@ def register():
         elif User.query.filter_by(email=email).first():
             flash('Email already exists', 'error')
         else:
+            try:
+                password_hash = passwords.hash_password(password)
+            except HashingBusy:
+                return _hashing_busy('auth/register.html')
             user = User(
                 username=username,
                 email=email,
-                password_hash=generate_password_hash(password),
+                password_hash=password_hash,
                 first_name=first_name,
                 last_name=last_name,
                 role='member'
             )
             db.session.add(user)
+            stats.record_member_added()
             db.session.commit()
             
             flash('Registration successful! Please login.', 'success')
@@ -1,65 +1,122 @@
-from flask import Blueprint, render_template, request, flash
+import io
+from types import SimpleNamespace
+from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, current_app
+from markupsafe import Markup
+from sqlalchemy import func, select
 from flask_login import login_required, current_user
 from models import db
 from models.book import Book
 from models.transaction import Transaction, Reservation
-from sqlalchemy import or_
+from utils.search import search_books
+from utils.fuzzy import fuzzy_search, fuzzy_search_enabled, index_book
+from utils.pagination import KeysetPage, paginate_query
+from utils import stats
+from utils.cache import cache
+from utils.importer import IMPORT_FORMATS, detect_format, import_books
+from utils.recommendations import recommendations_for
 
 book_bp = Blueprint('books', __name__)
 
-@book_bp.route('/books')
-def book_catalog():
-    page = request.args.get('page', 1, type=int)
-    category = request.args.get('category', '')
-    search = request.args.get('search', '')
-    
+
+def catalog_query(category='', search=''):
     query = Book.query
     
     if category:
         query = query.filter(Book.category == category)
     
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                Book.title.ilike(search_term),
-                Book.author.ilike(search_term),
-                Book.isbn.ilike(search_term),
-                Book.category.ilike(search_term)
-            )
-        )
+        query = search_books(query, search)
     
-    books = query.order_by(Book.title).paginate(page=page, per_page=12, error_out=False)
+    return query.order_by(Book.title)
+
+
+@book_bp.route('/books')
+def book_catalog():
+    category = request.args.get('category', '')
+    search = request.args.get('search', '')
+    
+    def render_results():
+        # Searches stay on page numbers so they keep the FTS relevance order.
+        # The whole catalog's size comes from the counter, not a count of books.
+        whole_catalog = not category and not search
+        books = paginate_query(catalog_query(category, search), (Book.title, Book.id), per_page=12,
+                               keyset=not search,
+                               total=(lambda: stats.get_counters()['books'].count) if whole_catalog else None)
+        fuzzy = False
+        # Anything the exact search finds is trusted; only a first page
+        # with nothing on it falls back to the closest spellings
+        if search and not books.items and not books.has_prev and fuzzy_search_enabled():
+            books = KeysetPage(fuzzy_search(search, category, limit=12))
+            fuzzy = True
+        return render_template('books/_catalog_results.html',
+                               books=books,
+                               fuzzy=fuzzy,
+                               current_category=category,
+                               search_term=search)
+    
+    # The results grid is the same for every visitor, so it is cached
+    # rendered; add/edit/borrow/return bump the 'catalog' version.
+    results_key = (category, search, request.args.get('page', 1, type=int),
+                   request.args.get('cursor'), current_app.config.get('PAGINATION_MODE'))
+    results = cache.get_or_set('catalog', results_key, render_results)
     
-    categories = db.session.query(Book.category).distinct().all()
-    categories = [cat[0] for cat in categories]
+    categories = cached_categories()
     
     return render_template('books/catalog.html', 
-                         books=books, 
+                         results=Markup(results), 
                          categories=categories,
                          current_category=category,
                          search_term=search)
 
+
+def categories_query():
+    # Hop from each category to the next through ix_books_category_title,
+    # one index seek per category, instead of a DISTINCT over every book
+    categories = select(select(func.min(Book.category)).scalar_subquery().label('category')) \
+        .cte('categories', recursive=True)
+    categories = categories.union_all(
+        select(select(func.min(Book.category)).where(Book.category > categories.c.category)
+               .scalar_subquery()).where(categories.c.category.is_not(None))
+    )
+    return db.session.query(categories.c.category).filter(
+        categories.c.category.is_not(None)).order_by(categories.c.category)
+
+
+def cached_categories():
+    return cache.get_or_set('categories', 'all', lambda: [cat[0] for cat in categories_query()])
+
+
+def book_reservations_query(book_id):
+    return Reservation.query.filter_by(book_id=book_id, status='active')
+
+
+def user_reservation_query(user_id, book_id):
+    return Reservation.query.filter_by(user_id=user_id, book_id=book_id, status='active')
+
+
+def load_book_details(book_id):
+    book = db.session.get(Book, book_id)
+    if book is None:
+        return None
+    details = {column.name: getattr(book, column.name) for column in Book.__table__.columns}
+    details['reservation_count'] = book_reservations_query(book_id).count()
+    details['recommendations'] = [row._asdict() for row in recommendations_for(book_id)]
+    return details
+
 @book_bp.route('/books/<int:book_id>')
 def book_details(book_id):
-    book = Book.query.get_or_404(book_id)
+    details = cache.get_or_set(f'book:{book_id}', 'details', lambda: load_book_details(book_id))
+    if details is None:
+        abort(404)
+    
     user_reservation = None
     if current_user.is_authenticated:
-        user_reservation = Reservation.query.filter_by(
-            user_id=current_user.id, 
-            book_id=book_id, 
-            status='active'
-        ).first()
-    
-    reservation_count = Reservation.query.filter_by(
-        book_id=book_id, 
-        status='active'
-    ).count()
+        user_reservation = user_reservation_query(current_user.id, book_id).first()
     
     return render_template('books/book_detail.html', 
-                         book=book, 
+                         book=SimpleNamespace(**details), 
                          user_reservation=user_reservation,
-                         reservation_count=reservation_count)
+                         reservation_count=details['reservation_count'])
 
 @book_bp.route('/books/add', methods=['GET', 'POST'])
 @login_required
@@ -83,7 +140,10 @@ def add_book():
         )
         
         db.session.add(book)
+        stats.record_book_added()
         db.session.commit()
+        cache.bump('catalog', 'categories', f'book:{book.id}')
+        index_book(book.id, book.title, book.author)
         flash('Book added successfully!', 'success')
         return redirect(url_for('books.book_details', book_id=book.id))
     
@@ -99,6 +159,7 @@ def edit_book(book_id):
     book = Book.query.get_or_404(book_id)
     
     if request.method == 'POST':
+        previous = (book.title, book.author)
         book.title = request.form.get('title')
         book.author = request.form.get('author')
         book.isbn = request.form.get('isbn')
@@ -107,9 +168,37 @@ def edit_book(book_id):
         book.publication_year = request.form.get('publication_year')
         book.location = request.form.get('location')
         book.description = request.form.get('description')
+        book.version = Book.version + 1
         
         db.session.commit()
+        cache.bump('catalog', 'categories', f'book:{book.id}')
+        index_book(book.id, book.title, book.author, previous=previous)
         flash('Book updated successfully!', 'success')
         return redirect(url_for('books.book_details', book_id=book.id))
     
-    return render_template('books/manage_books.html', book=book)
\ No newline at end of file
+    return render_template('books/manage_books.html', book=book)
+
+
+@book_bp.route('/books/import', methods=['GET', 'POST'])
+@login_required
+def import_books_upload():
+    if current_user.role not in ['librarian', 'admin']:
+        flash('Access denied. Librarian role required.', 'error')
+        return redirect(url_for('books.book_catalog'))
+    
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        fmt = request.form.get('format') or detect_format(upload.filename if upload else None)
+        if not upload or not upload.filename:
+            flash('Choose a file to import.', 'error')
+        elif fmt not in IMPORT_FORMATS:
+            flash('Unknown file format; choose CSV, JSONL or MARC-lite.', 'error')
+        else:
+            # Read the upload as a text stream so rows are parsed as they arrive
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            report = import_books(stream, fmt)
+            flash(f'Imported {report.rows} rows: {report.inserted} added, {report.updated} updated, '
+                  f'{report.duplicates} duplicates, {report.failed} rejected.', 'success' if not report.failed else 'warning')
+    
+    return render_template('books/import_books.html', report=report)
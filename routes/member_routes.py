@@ -1,33 +1,58 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
 from models import db
-from models.transaction import Transaction, Reservation, Fine
+from models.user import User
+from models.transaction import Transaction, Reservation, Fine, LoanRecord
 from datetime import datetime
+from sqlalchemy.orm import joinedload
+from utils.pagination import paginate_query
 
 member_bp = Blueprint('member', __name__)
 
+
+def current_loans_query(user_id):
+    return Transaction.query.options(
+        joinedload(Transaction.book)
+    ).filter_by(user_id=user_id, status='borrowed')
+
+
+def active_reservations_query(user_id):
+    return Reservation.query.options(
+        joinedload(Reservation.book)
+    ).filter_by(user_id=user_id, status='active')
+
+
+def unpaid_fines_query(user_id):
+    return Fine.query.filter_by(user_id=user_id, status='unpaid')
+
+
+def recent_transactions_query(user_id, limit=10):
+    return Transaction.query.options(
+        joinedload(Transaction.book)
+    ).filter_by(user_id=user_id).order_by(Transaction.borrow_date.desc()).limit(limit)
+
+
+def borrowing_history_query(user_id):
+    return LoanRecord.query.options(
+        joinedload(LoanRecord.book)
+    ).filter_by(user_id=user_id).order_by(LoanRecord.borrow_date.desc(), LoanRecord.id.desc())
+
+
+def members_query():
+    return User.query.filter_by(role='member').order_by(User.join_date.desc())
+
+
 @member_bp.route('/dashboard')
 @login_required
 def dashboard():
 
-    current_loans = Transaction.query.filter_by(
-        user_id=current_user.id, 
-        status='borrowed'
-    ).all()
+    current_loans = current_loans_query(current_user.id).all()
     
-    active_reservations = Reservation.query.filter_by(
-        user_id=current_user.id, 
-        status='active'
-    ).all()
+    active_reservations = active_reservations_query(current_user.id).all()
     
-    unpaid_fines = Fine.query.filter_by(
-        user_id=current_user.id, 
-        status='unpaid'
-    ).all()
+    unpaid_fines = unpaid_fines_query(current_user.id).all()
     
-    recent_transactions = Transaction.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Transaction.borrow_date.desc()).limit(10).all()
+    recent_transactions = recent_transactions_query(current_user.id).all()
     
     total_fine = sum(fine.amount for fine in unpaid_fines)
     
@@ -42,12 +67,11 @@ def dashboard():
 @member_bp.route('/borrowing-history')
 @login_required
 def borrowing_history():
-    page = request.args.get('page', 1, type=int)
-    
-    transactions = Transaction.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Transaction.borrow_date.desc()).paginate(
-        page=page, per_page=20, error_out=False
+    transactions = paginate_query(
+        borrowing_history_query(current_user.id),
+        (LoanRecord.borrow_date, LoanRecord.id),
+        per_page=20,
+        descending=True
     )
     
     return render_template('members/borrowing_history.html', 
@@ -60,9 +84,12 @@ def manage_members():
         flash('Access denied. Librarian role required.', 'error')
         return redirect(url_for('index'))
     
-    page = request.args.get('page', 1, type=int)
-    members = User.query.filter_by(role='member').order_by(
-        User.join_date.desc()
-    ).paginate(page=page, per_page=20, error_out=False)
+    members = paginate_query(
+        members_query(),
+        (User.join_date, User.id),
+        per_page=20,
+        descending=True,
+        with_total=not request.args.get('cursor')
+    )
     
     return render_template('members/manage_members.html', members=members)
\ No newline at end of file
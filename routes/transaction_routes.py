@@ -1,49 +1,40 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import re
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from models import db
 from models.book import Book
-from models.transaction import Transaction, Reservation, Fine
+from models.transaction import Transaction, Reservation, Fine, FineRecord
 from models.user import User
-from datetime import datetime, timedelta
+from datetime import datetime
+from sqlalchemy import update
+from utils import stats
+from utils import circulation
+from utils.circulation import CirculationError
+from utils.cache import cache
+from routes.book_routes import user_reservation_query
+from routes.member_routes import active_reservations_query
 
 transaction_bp = Blueprint('transaction', __name__)
 
+
+def fines_query(user_id):
+    return FineRecord.query.filter_by(user_id=user_id).order_by(FineRecord.issue_date.desc())
+
+
 @transaction_bp.route('/borrow/<int:book_id>')
 @login_required
 def borrow_book(book_id):
     book = Book.query.get_or_404(book_id)
     
-    if book.available_copies <= 0:
-        flash('No copies available for borrowing.', 'error')
-        return redirect(url_for('books.book_details', book_id=book_id))
-    
-    # Check if user already has this book borrowed
-    existing_loan = Transaction.query.filter_by(
-        user_id=current_user.id, 
-        book_id=book_id, 
-        status='borrowed'
-    ).first()
-    
-    if existing_loan:
-        flash('You have already borrowed this book.', 'error')
+    try:
+        transaction = circulation.checkout(current_user.id, book_id)
+    except CirculationError as e:
+        db.session.rollback()
+        flash(str(e), 'error')
         return redirect(url_for('books.book_details', book_id=book_id))
     
-    # Create transaction
-    transaction = Transaction(
-        user_id=current_user.id,
-        book_id=book_id,
-        borrow_date=datetime.utcnow(),
-        due_date=datetime.utcnow() + timedelta(days=14),
-        status='borrowed'
-    )
-    
-    # Update book availability
-    book.available_copies -= 1
-    if book.available_copies == 0:
-        book.status = 'checked_out'
-    
-    db.session.add(transaction)
     db.session.commit()
+    cache.bump('catalog', f'book:{book_id}')
     
     flash(f'Book "{book.title}" borrowed successfully! Due date: {transaction.due_date.strftime("%Y-%m-%d")}', 'success')
     return redirect(url_for('member.dashboard'))
@@ -57,36 +48,84 @@ def return_book(transaction_id):
         flash('Access denied.', 'error')
         return redirect(url_for('index'))
     
-    book = Book.query.get(transaction.book_id)
-    
-    # Update transaction
-    transaction.return_date = datetime.utcnow()
-    transaction.status = 'returned'
-    
-    # Update book availability
-    book.available_copies += 1
-    if book.status == 'checked_out':
-        book.status = 'available'
-    
-    # Check for overdue and create fine if applicable
-    if transaction.return_date > transaction.due_date:
-        days_overdue = (transaction.return_date - transaction.due_date).days
-        fine_amount = days_overdue * 0.50  # £0.50 per day
-        
-        fine = Fine(
-            user_id=transaction.user_id,
-            transaction_id=transaction.id,
-            amount=round(fine_amount, 2),
-            reason='overdue',
-            issue_date=datetime.utcnow()
-        )
-        db.session.add(fine)
-        flash(f'Book returned. Overdue fine: £{fine_amount:.2f}', 'warning')
+    try:
+        fine = circulation.checkin(transaction)
+    except CirculationError as e:
+        db.session.rollback()
+        flash(str(e), 'info')
+        return redirect(url_for('member.dashboard'))
+    
+    db.session.commit()
+    cache.bump('catalog', f'book:{transaction.book_id}')
+    
+    if fine:
+        flash(f'Book returned. Overdue fine: £{fine.amount:.2f}', 'warning')
     else:
         flash('Book returned successfully!', 'success')
+    return redirect(url_for('member.dashboard'))
+
+@transaction_bp.route('/circulation/batch', methods=['GET', 'POST'])
+@login_required
+def batch_circulation():
+    """Check a patron's scanned items out or in with one request and one commit.
+
+    Takes a form post from the desk page or JSON from scanner software:
+    {"patron": <id or username>, "action": "checkout"|"checkin", "items": [book ids]}.
+    """
+    wants_json = request.is_json
+    
+    def fail(message, status=400):
+        if wants_json:
+            return jsonify(error=message), status
+        flash(message, 'error')
+        return render_template('transactions/batch_circulation.html', results=None), status
+    
+    if current_user.role not in ['librarian', 'admin']:
+        return fail('Access denied. Librarian role required.', 403)
+    
+    if request.method == 'GET':
+        return render_template('transactions/batch_circulation.html', results=None)
+    
+    data = (request.get_json(silent=True) or {}) if wants_json else request.form
+    patron = str(data.get('patron', '')).strip()
+    action = data.get('action')
+    items = data.get('items', '')
+    if isinstance(items, str):
+        items = re.split(r'[\s,;]+', items.strip()) if items.strip() else []
+    try:
+        items = [int(item) for item in items]
+    except (TypeError, ValueError):
+        return fail('Items must be book ids.')
+    if action not in ('checkout', 'checkin'):
+        return fail('Action must be checkout or checkin.')
+    if not items:
+        return fail('No items scanned.')
+    
+    member = User.query.filter(
+        (User.username == patron) | (User.id == (int(patron) if patron.isdigit() else -1))
+    ).first()
+    if member is None:
+        return fail('Unknown patron.', 404)
+    
+    process = circulation.checkout_many if action == 'checkout' else circulation.checkin_many
+    try:
+        results = process(member.id, items)
+    except CirculationError as e:
+        db.session.rollback()
+        return fail(str(e), 409)
     
     db.session.commit()
-    return redirect(url_for('member.dashboard'))
+    done = [result['item'] for result in results if result['ok']]
+    if done:
+        cache.bump('catalog', *[f'book:{book_id}' for book_id in done])
+    
+    if wants_json:
+        for result in results:
+            if result.get('due_date'):
+                result['due_date'] = result['due_date'].isoformat()
+        return jsonify(patron=member.id, action=action, results=results)
+    return render_template('transactions/batch_circulation.html',
+                         results=results, patron=member, action=action)
 
 @transaction_bp.route('/reserve/<int:book_id>')
 @login_required
@@ -99,11 +138,7 @@ def reserve_book(book_id):
         return redirect(url_for('books.book_details', book_id=book_id))
     
     # Check if user already has active reservation
-    existing_reservation = Reservation.query.filter_by(
-        user_id=current_user.id, 
-        book_id=book_id, 
-        status='active'
-    ).first()
+    existing_reservation = user_reservation_query(current_user.id, book_id).first()
     
     if existing_reservation:
         flash('You already have an active reservation for this book.', 'error')
@@ -118,7 +153,10 @@ def reserve_book(book_id):
     )
     
     db.session.add(reservation)
+    # The reservation count is part of the book's API representation
+    db.session.execute(update(Book).where(Book.id == book_id).values(version=Book.version + 1))
     db.session.commit()
+    cache.bump(f'book:{book_id}')
     
     flash('Book reserved successfully! You will be notified when it becomes available.', 'success')
     return redirect(url_for('books.book_details', book_id=book_id))
@@ -126,20 +164,15 @@ def reserve_book(book_id):
 @transaction_bp.route('/reservations')
 @login_required
 def view_reservations():
-    active_reservations = Reservation.query.filter_by(
-        user_id=current_user.id, 
-        status='active'
-    ).all()
+    active_reservations = active_reservations_query(current_user.id).all()
     
-    return render_template('transactions/reservations.html', 
+    return render_template('transactions/reservation.html', 
                          reservations=active_reservations)
 
 @transaction_bp.route('/fines')
 @login_required
 def view_fines():
-    fines = Fine.query.filter_by(user_id=current_user.id).order_by(
-        Fine.issue_date.desc()
-    ).all()
+    fines = fines_query(current_user.id).all()
     
     total_unpaid = sum(fine.amount for fine in fines if fine.status == 'unpaid')
     
@@ -156,8 +189,13 @@ def pay_fine(fine_id):
         flash('Access denied.', 'error')
         return redirect(url_for('index'))
     
+    if fine.status == 'paid':
+        flash('This fine has already been paid.', 'info')
+        return redirect(url_for('transaction.view_fines'))
+    
     fine.status = 'paid'
     fine.paid_date = datetime.utcnow()
+    stats.record_fine_paid(fine.amount)
     
     db.session.commit()
     flash(f'Fine of £{fine.amount:.2f} paid successfully!', 'success')
@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+import pytest
+
+# Config reads DATABASE_URL when it is first imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'library-test.db')
+os.environ['SEARCH_SNAPSHOT'] = os.path.join(tempfile.mkdtemp(), 'search-trigrams.pickle')
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    from utils.migrations import upgrade_database
+    from utils.seed_data import generate_data
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        upgrade_database()
+        generate_data(users=50, books=100, years=1, transactions=400, seed=7)
+    return app
+
+
+@pytest.fixture(scope='session')
+def users(app):
+    """Usernames of a member with loans, fines and reservations and of a librarian"""
+    from sqlalchemy import func
+    from models import db
+    from models.user import User
+    from models.transaction import Transaction
+
+    with app.app_context():
+        busiest = db.session.query(Transaction.user_id).group_by(Transaction.user_id).order_by(
+            func.count().desc()).limit(1).scalar()
+        member = db.session.get(User, busiest)
+        librarian = User.query.filter_by(role='librarian').first()
+        return {'member': member.username, 'librarian': librarian.username}
+
+
+def login(client, username):
+    response = client.post('/login', data={'username': username, 'password': 'password123'})
+    assert response.status_code == 302
+    return client
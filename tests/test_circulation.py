@@ -0,0 +1,67 @@
+import random
+import threading
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+from models import db
+from models.book import Book
+from models.transaction import Transaction
+from models.user import User
+from utils import circulation
+from utils.circulation import CirculationError
+
+
+def test_concurrent_checkout_and_checkin_keep_inventory(app):
+    """Borrow and return the same few copies from many threads at once"""
+    with app.app_context():
+        books = [Book(title=f'Stress {i}', author='Test', isbn=f'stress-{i}', category='Test',
+                      total_copies=2, available_copies=2) for i in range(2)]
+        users = [User(username=f'stress{i}', email=f'stress{i}@example.com', password_hash='!',
+                      first_name='Stress', last_name=str(i)) for i in range(6)]
+        db.session.add_all(books + users)
+        db.session.commit()
+        book_ids = [book.id for book in books]
+        user_ids = [user.id for user in users]
+
+    errors = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(60):
+            with app.app_context():
+                user_id = rng.choice(user_ids)
+                try:
+                    if rng.random() < 0.6:
+                        circulation.checkout(user_id, rng.choice(book_ids))
+                    else:
+                        loan = Transaction.query.filter(
+                            Transaction.user_id == user_id, Transaction.status == 'borrowed',
+                            Transaction.book_id.in_(book_ids)).first()
+                        if loan is None:
+                            continue
+                        circulation.checkin(loan)
+                    db.session.commit()
+                except (CirculationError, OperationalError):
+                    # Rejected, or SQLite's writer lock timed out
+                    db.session.rollback()
+                except Exception as e:
+                    db.session.rollback()
+                    errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with app.app_context():
+        for book in Book.query.filter(Book.id.in_(book_ids)):
+            open_loans = Transaction.query.filter_by(book_id=book.id, status='borrowed').count()
+            assert 0 <= book.available_copies
+            assert book.available_copies + open_loans == book.total_copies
+        duplicates = db.session.query(Transaction.user_id, Transaction.book_id).filter(
+            Transaction.status == 'borrowed', Transaction.book_id.in_(book_ids)
+        ).group_by(Transaction.user_id, Transaction.book_id).having(func.count() > 1).all()
+        assert duplicates == []
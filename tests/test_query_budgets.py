@@ -0,0 +1,41 @@
+import pytest
+
+from conftest import login
+
+# One request per QUERY_BUDGETS endpoint (several for the catalog's
+# branches), as the member, the librarian or nobody
+REQUESTS = [
+    ('books.book_catalog', None, '/books'),
+    ('books.book_catalog', None, '/books?category=Science&page=2'),
+    ('books.book_catalog', None, '/books?search=history'),
+    ('books.book_catalog', None, '/books?search=histroy'),
+    ('books.book_details', None, '/books/1'),
+    ('books.book_details', 'member', '/books/2'),
+    ('member.dashboard', 'member', '/dashboard'),
+    ('member.borrowing_history', 'member', '/borrowing-history'),
+    ('member.manage_members', 'librarian', '/members'),
+    ('admin.generate_reports', 'librarian', '/reports'),
+    ('admin.generate_reports', 'librarian', '/reports?window=30&category=Science'),
+    ('transaction.view_reservations', 'member', '/reservations'),
+    ('transaction.view_fines', 'member', '/fines'),
+    ('api.list_books', None, '/api/v1/books'),
+    ('api.list_books', None, '/api/v1/books?search=history'),
+    ('api.get_book', None, '/api/v1/books/1'),
+]
+
+
+def test_every_budgeted_endpoint_is_requested(app):
+    assert set(app.config['QUERY_BUDGETS']) == {endpoint for endpoint, _, _ in REQUESTS}
+
+
+@pytest.mark.parametrize('endpoint, role, path', REQUESTS)
+def test_query_budget(app, users, endpoint, role, path):
+    client = app.test_client()
+    if role:
+        login(client, users[role])
+    # Cold and then cached; with TESTING an over-budget request raises
+    # QueryBudgetExceeded out of the test client
+    for _ in range(2):
+        response = client.get(path)
+        assert response.status_code == 200
+    assert app.url_map.bind('localhost').match(path.partition('?')[0])[0] == endpoint
@@ -0,0 +1,20 @@
+from utils.query_plans import find_full_scans, is_full_scan, route_queries
+
+
+def test_route_queries_use_indexes(app):
+    with app.app_context():
+        assert find_full_scans() == {}
+
+
+def test_unbounded_index_walks_are_full_scans():
+    assert is_full_scan('SCAN books')
+    assert is_full_scan('SCAN books USING COVERING INDEX ix_books_category_title')
+    assert not is_full_scan('SCAN books USING INDEX ix_books_title', limited=True)
+    assert not is_full_scan('SEARCH books USING INDEX ix_books_category_title (category=?)')
+    assert not is_full_scan('SCAN categories', derived={'categories'})
+
+
+def test_page_numbers_totals_are_planned(app):
+    with app.app_context():
+        assert {'book_catalog[category][count]', 'borrowing_history[count]',
+                'manage_members[count]'} <= set(route_queries())
@@ -0,0 +1,154 @@
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from utils.replicas import use_primary
+
+_MISSING = object()
+
+
+class NullCacheBackend:
+    """Caches nothing; every lookup goes to the database"""
+
+    def get(self, key):
+        return _MISSING
+
+    def set(self, key, value, ttl):
+        pass
+
+    def get_version(self, namespace):
+        return 0
+
+    def incr_version(self, namespace):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCacheBackend:
+    """Thread-safe in-process cache bounded by entry count and TTL.
+
+    Namespace versions live outside the LRU so they can't be evicted. The
+    cache is per worker process: a version bump only invalidates entries in
+    the process that made the write, other workers see it after the TTL.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_version(self, namespace):
+        return self._versions.get(namespace, 0)
+
+    def incr_version(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+
+class RedisCacheBackend:
+    """Shared cache for multi-worker deployments (requires the redis package)"""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return _MISSING if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, pickle.dumps(value), ex=max(1, int(ttl)))
+
+    def get_version(self, namespace):
+        return int(self.client.get(f'version:{namespace}') or 0)
+
+    def incr_version(self, namespace):
+        self.client.incr(f'version:{namespace}')
+
+    def clear(self):
+        self.client.flushdb()
+
+
+class Cache:
+    """Read-through cache whose entries are invalidated by namespace versions.
+
+    Writers call bump() for the namespaces they affect; every entry stored
+    under an older version is simply never read again and ages out.
+    """
+
+    def __init__(self, backend=None, default_ttl=60, prefix='library'):
+        self.backend = backend or NullCacheBackend()
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, namespace, key):
+        version = self.backend.get_version(namespace)
+        return f'{self.prefix}:{namespace}:{version}:{json.dumps(key, sort_keys=True, default=str)}'
+
+    def get_or_set(self, namespace, key, factory, ttl=None):
+        cache_key = self._key(namespace, key)
+        value = self.backend.get(cache_key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        # Filled from the primary: a replica read right after a write's bump
+        # would store the old data under the new version for the whole TTL
+        with use_primary():
+            value = factory()
+        self.backend.set(cache_key, value, ttl or self.default_ttl)
+        return value
+
+    def bump(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.incr_version(namespace)
+
+    def clear(self):
+        self.backend.clear()
+
+
+cache = Cache()
+
+
+def init_cache(app):
+    backend_name = app.config.get('CACHE_BACKEND', 'lru')
+    if backend_name == 'redis':
+        backend = RedisCacheBackend(app.config['CACHE_REDIS_URL'])
+    elif backend_name == 'lru':
+        backend = LRUCacheBackend(app.config.get('CACHE_MAX_ENTRIES', 2048))
+    else:
+        backend = NullCacheBackend()
+    cache.backend = backend
+    cache.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 60)
+    app.extensions['cache'] = cache
+    return cache
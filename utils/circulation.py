@@ -0,0 +1,289 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from models import db
+from models.book import Book
+from models.transaction import Transaction, Fine
+from utils import stats
+from utils import notifications
+
+
+class CirculationError(Exception):
+    pass
+
+
+def loan_period():
+    return timedelta(days=current_app.config.get('LOAN_PERIOD_DAYS', 14))
+
+
+def open_loan_query(user_id, book_id):
+    return Transaction.query.filter_by(user_id=user_id, book_id=book_id, status='borrowed')
+
+
+def overdue_fine(due_date, returned_at):
+    days_overdue = (returned_at - due_date).days
+    return round(days_overdue * current_app.config.get('FINE_PER_DAY', 0.50), 2)
+
+
+def checkout(user_id, book_id, now=None):
+    """Lend one copy of a book and return the new Transaction.
+
+    The copy is taken with a single conditional UPDATE, so concurrent
+    borrows of the last copy can't both succeed, and the partial unique
+    index on open loans rejects a second loan of the same book. Raises
+    CirculationError; the caller should roll back and not commit then.
+    """
+    now = now or datetime.utcnow()
+
+    existing_loan = open_loan_query(user_id, book_id).first()
+    if existing_loan:
+        raise CirculationError('You have already borrowed this book.')
+
+    taken = db.session.execute(
+        update(Book)
+        .where(Book.id == book_id, Book.available_copies > 0)
+        .values(
+            available_copies=Book.available_copies - 1,
+            status=case((Book.available_copies <= 1, 'checked_out'), else_=Book.status),
+            version=Book.version + 1
+        )
+    ).rowcount
+    if not taken:
+        raise CirculationError('No copies available for borrowing.')
+
+    transaction = Transaction(
+        user_id=user_id,
+        book_id=book_id,
+        borrow_date=now,
+        due_date=now + loan_period(),
+        status='borrowed'
+    )
+    db.session.add(transaction)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Lost a race against another borrow of the same book by this user
+        db.session.rollback()
+        raise CirculationError('You have already borrowed this book.')
+
+    stats.record_borrow(book_id, user_id, now.date())
+    return transaction
+
+
+def _settle_overdue_fines(loans, now):
+    """Fine the overdue loans among ``loans`` (just closed at ``now``).
+
+    An overdue fine accrued while a loan was open is brought up to its
+    final amount rather than duplicated. Fines the member already paid on
+    the loan are deducted, and only the remainder is owed. Returns
+    {transaction_id: Fine}.
+    """
+    overdue = [loan for loan in loans if now > loan.due_date]
+    if not overdue:
+        return {}
+    # The accrual job may already have fined some of them while they were out
+    accrued, paid = {}, {}
+    for fine in Fine.query.filter(
+        Fine.transaction_id.in_([loan.id for loan in overdue]),
+        Fine.reason == 'overdue'
+    ):
+        if fine.status == 'unpaid':
+            accrued[fine.transaction_id] = fine
+        else:
+            paid[fine.transaction_id] = paid.get(fine.transaction_id, 0.0) + fine.amount
+    fines, new_count, added_amount = {}, 0, 0.0
+    for loan in overdue:
+        amount = round(overdue_fine(loan.due_date, now) - paid.get(loan.id, 0.0), 2)
+        fine = accrued.get(loan.id)
+        if fine is not None:
+            added_amount += amount - fine.amount
+            fine.amount = amount
+        elif amount > 0:
+            fine = Fine(
+                user_id=loan.user_id,
+                transaction_id=loan.id,
+                amount=amount,
+                reason='overdue',
+                issue_date=now
+            )
+            db.session.add(fine)
+            new_count += 1
+            added_amount += amount
+        else:
+            # Paid up to the day it came back
+            continue
+        fines[loan.id] = fine
+    if new_count or added_amount:
+        stats.bump('unpaid_fines', new_count, added_amount)
+    return fines
+
+
+def _return_copies(book_ids):
+    # A member holds at most one open loan per book, so each id appears once
+    db.session.execute(
+        update(Book)
+        .where(Book.id.in_(book_ids))
+        .values(
+            available_copies=Book.available_copies + 1,
+            status=case((Book.status == 'checked_out', 'available'), else_=Book.status),
+            version=Book.version + 1
+        )
+    )
+    stats.record_return(len(book_ids))
+    notifications.notify_reservation_holders(book_ids)
+
+
+def checkin(transaction, now=None):
+    """Close an open loan and put the copy back; returns the overdue Fine or None.
+
+    Closing the loan is conditional on it still being open, so a double
+    submit or two librarians returning the same item only count it once.
+    The next reservation holder's notice goes into the outbox in the same
+    transaction.
+    """
+    now = now or datetime.utcnow()
+
+    closed = db.session.execute(
+        update(Transaction)
+        .where(Transaction.id == transaction.id, Transaction.status == 'borrowed')
+        .values(status='returned', return_date=now)
+    ).rowcount
+    if not closed:
+        raise CirculationError('This book has already been returned.')
+
+    _return_copies([transaction.book_id])
+    return _settle_overdue_fines([transaction], now).get(transaction.id)
+
+
+def _unique(ids):
+    seen = set()
+    return [i for i in ids if not (i in seen or seen.add(i))]
+
+
+def _in_scan_order(scanned, results):
+    # The first scan of an item carries its result; repeats are flagged
+    seen, ordered = set(), []
+    for item in scanned:
+        if item in seen:
+            ordered.append({'item': item, 'ok': False, 'message': 'Scanned twice.'})
+        else:
+            seen.add(item)
+            ordered.append(dict(results[item], item=item))
+    return ordered
+
+
+def checkout_many(user_id, book_ids, now=None):
+    """Lend several books to one member with a handful of set-based statements.
+
+    Returns one result dict per scanned id, in scan order: ``ok``, a
+    ``message`` and, for loans, the new ``transaction`` id and ``due_date``.
+    Items that can't be lent are reported, not raised; the caller commits
+    once for the whole batch. Raises CirculationError only if a concurrent
+    desk lent one of the same books to this member mid-batch.
+    """
+    now = now or datetime.utcnow()
+    results = {}
+    wanted = _unique(book_ids)
+
+    known = dict(db.session.query(Book.id, Book.title).filter(Book.id.in_(wanted)))
+    on_loan = set(db.session.execute(
+        select(Transaction.book_id).where(
+            Transaction.user_id == user_id,
+            Transaction.book_id.in_(wanted),
+            Transaction.status == 'borrowed'
+        )
+    ).scalars())
+    candidates = []
+    for book_id in wanted:
+        if book_id not in known:
+            results[book_id] = {'ok': False, 'message': 'No such book.'}
+        elif book_id in on_loan:
+            results[book_id] = {'ok': False, 'message': 'Already borrowed by this member.'}
+        else:
+            candidates.append(book_id)
+
+    taken = set()
+    if candidates:
+        taken = set(db.session.execute(
+            update(Book)
+            .where(Book.id.in_(candidates), Book.available_copies > 0)
+            .values(
+                available_copies=Book.available_copies - 1,
+                status=case((Book.available_copies <= 1, 'checked_out'), else_=Book.status),
+                version=Book.version + 1
+            )
+            .returning(Book.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+
+    due_date = now + loan_period()
+    lent = [book_id for book_id in candidates if book_id in taken]
+    if lent:
+        try:
+            loan_ids = db.session.execute(
+                insert(Transaction).returning(Transaction.id, Transaction.book_id, sort_by_parameter_order=True),
+                [{'user_id': user_id, 'book_id': book_id, 'borrow_date': now,
+                  'due_date': due_date, 'status': 'borrowed', 'renewal_count': 0}
+                 for book_id in lent]
+            ).all()
+        except IntegrityError:
+            db.session.rollback()
+            raise CirculationError('One of these books was lent to this member at another desk; '
+                                   'nothing was checked out, please scan again.')
+        stats.record_borrows(user_id, lent, now.date())
+        for loan_id, book_id in loan_ids:
+            results[book_id] = {'ok': True, 'message': f'Due {due_date:%Y-%m-%d}.',
+                                'transaction': loan_id, 'due_date': due_date}
+    for book_id in candidates:
+        results.setdefault(book_id, {'ok': False, 'message': 'No copies available.'})
+
+    return _in_scan_order(book_ids, {book_id: dict(result, title=known.get(book_id))
+                                     for book_id, result in results.items()})
+
+
+def checkin_many(user_id, book_ids, now=None):
+    """Return several of one member's books, fining the late ones in one pass.
+
+    Scans are book ids, matched against the member's open loans. Returns a
+    result dict per scanned id as checkout_many() does, with any ``fine``
+    amount; the caller commits once.
+    """
+    now = now or datetime.utcnow()
+    wanted = _unique(book_ids)
+    loans = {loan.book_id: loan for loan in Transaction.query.options(
+        joinedload(Transaction.book)
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.book_id.in_(wanted),
+        Transaction.status == 'borrowed'
+    )}
+
+    closed = set()
+    if loans:
+        closed = set(db.session.execute(
+            update(Transaction)
+            .where(Transaction.id.in_([loan.id for loan in loans.values()]),
+                   Transaction.status == 'borrowed')
+            .values(status='returned', return_date=now)
+            .returning(Transaction.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+    returned = [loan for loan in loans.values() if loan.id in closed]
+    fines = {}
+    if returned:
+        _return_copies([loan.book_id for loan in returned])
+        fines = _settle_overdue_fines(returned, now)
+
+    results = {}
+    for book_id in wanted:
+        loan = loans.get(book_id)
+        if loan is None or loan.id not in closed:
+            results[book_id] = {'ok': False, 'message': 'Not on loan to this member.'}
+            continue
+        fine = fines.get(loan.id)
+        results[book_id] = {'ok': True, 'transaction': loan.id, 'title': loan.book.title,
+                            'fine': fine.amount if fine else None,
+                            'message': f'Returned late, fine £{fine.amount:.2f}.' if fine else 'Returned.'}
+    return _in_scan_order(book_ids, results)
@@ -0,0 +1,95 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from models import db
+from utils.replicas import init_replicas, replica_binds
+
+# DB_ENGINE_PROFILE selects how the engine is tuned:
+#   default           - SQLAlchemy/pysqlite defaults
+#   sqlite-production - WAL, synchronous=NORMAL, busy_timeout, mmap and a
+#                       larger page cache on every connection, pooled
+#   postgresql        - sized, pre-pinged, recycled pool with a statement timeout
+#   auto              - sqlite-production or postgresql depending on the URL
+ENGINE_PROFILES = ('default', 'sqlite-production', 'postgresql', 'auto')
+
+
+def resolve_profile(app):
+    profile = app.config.get('DB_ENGINE_PROFILE') or 'default'
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f'Unknown DB_ENGINE_PROFILE {profile!r}; expected one of {ENGINE_PROFILES}')
+    if profile == 'auto':
+        backend = make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+        profile = {'sqlite': 'sqlite-production', 'postgresql': 'postgresql'}.get(backend, 'default')
+    return profile
+
+
+def engine_options(app, profile):
+    config = app.config
+    options = {}
+    if profile == 'sqlite-production':
+        url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+        if url.database and url.database != ':memory:':
+            options.update(
+                pool_size=config.get('DB_POOL_SIZE', 10),
+                max_overflow=config.get('DB_MAX_OVERFLOW', 10),
+                pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+            )
+        options['connect_args'] = {
+            # pysqlite's own lock wait, in seconds, on top of busy_timeout
+            'timeout': config.get('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000,
+            'check_same_thread': False,
+        }
+    elif profile == 'postgresql':
+        options.update(
+            pool_size=config.get('DB_POOL_SIZE', 10),
+            max_overflow=config.get('DB_MAX_OVERFLOW', 20),
+            pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            pool_use_lifo=True,
+            connect_args={
+                'application_name': 'library',
+                'options': f"-c statement_timeout={config.get('PG_STATEMENT_TIMEOUT_MS', 30000)}",
+            },
+        )
+    # Explicit SQLALCHEMY_ENGINE_OPTIONS always win over the profile
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    return options
+
+
+def sqlite_pragmas(app):
+    config = app.config
+    return [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{int(config.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def init_database(app):
+    """Apply the engine profile, then initialise Flask-SQLAlchemy and any replicas"""
+    profile = resolve_profile(app)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app, profile)
+    replica_keys = replica_binds(app)
+    db.init_app(app)
+
+    if profile == 'sqlite-production':
+        pragmas = sqlite_pragmas(app)
+
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.dialect.name == 'sqlite':
+                    event.listen(engine, 'connect', set_sqlite_pragmas)
+
+    init_replicas(app, replica_keys)
+    app.extensions['engine_profile'] = profile
+    return profile
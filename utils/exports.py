@@ -0,0 +1,153 @@
+import csv
+import io
+from datetime import datetime
+from sqlalchemy import select
+from models import db
+from models.book import Book
+from models.user import User
+from models.transaction import Transaction, LoanRecord, FineRecord
+
+EXPORTS = ('transactions', 'fines', 'overdue')
+EXPORT_FORMATS = ('csv', 'parquet')
+
+
+def export_statement(name, start=None, end=None, now=None):
+    """The SELECT behind an export, filtered to [start, end) on its date column.
+
+    transactions filter on borrow_date, fines on issue_date and overdue
+    (loans still out past their due date) on due_date. Transactions and
+    fines include archived rows.
+    """
+    if name == 'transactions':
+        stmt = select(
+            LoanRecord.id.label('transaction_id'), LoanRecord.user_id, User.username,
+            LoanRecord.book_id, Book.isbn, Book.title, LoanRecord.borrow_date,
+            LoanRecord.due_date, LoanRecord.return_date, LoanRecord.status,
+            LoanRecord.renewal_count
+        ).join(User, User.id == LoanRecord.user_id).join(Book, Book.id == LoanRecord.book_id)
+        date_column, order = LoanRecord.borrow_date, LoanRecord.id
+    elif name == 'fines':
+        stmt = select(
+            FineRecord.id.label('fine_id'), FineRecord.user_id, User.username,
+            FineRecord.transaction_id, FineRecord.amount, FineRecord.reason,
+            FineRecord.issue_date, FineRecord.paid_date, FineRecord.status
+        ).join(User, User.id == FineRecord.user_id)
+        date_column, order = FineRecord.issue_date, FineRecord.id
+    elif name == 'overdue':
+        stmt = select(
+            Transaction.id.label('transaction_id'), Transaction.user_id, User.username,
+            User.email, Transaction.book_id, Book.title, Transaction.borrow_date,
+            Transaction.due_date
+        ).join(User, User.id == Transaction.user_id).join(Book, Book.id == Transaction.book_id).where(
+            Transaction.status == 'borrowed',
+            Transaction.due_date < (now or datetime.utcnow())
+        )
+        date_column, order = Transaction.due_date, Transaction.due_date
+    else:
+        raise ValueError(f'Unknown export {name!r}; expected one of {EXPORTS}')
+
+    if start is not None:
+        stmt = stmt.where(date_column >= start)
+    if end is not None:
+        stmt = stmt.where(date_column < end)
+    return stmt.order_by(order)
+
+
+def iter_chunks(name, start=None, end=None, chunk_size=5000):
+    """Yield (column names, rows) chunks from a server-side cursor"""
+    result = db.session.execute(
+        export_statement(name, start, end).execution_options(yield_per=chunk_size)
+    )
+    columns = list(result.keys())
+    for rows in result.partitions():
+        yield columns, rows
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    return value
+
+
+def stream_csv(name, start=None, end=None, chunk_size=5000):
+    """CSV text, one piece per chunk of rows; the header comes even for no rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for columns, rows in iter_chunks(name, start, end, chunk_size):
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if not header_written:
+        writer.writerow(export_statement(name).selected_columns.keys())
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_schema(pa, name):
+    """Parquet column types from the SQL ones, so an all-NULL chunk can't change them"""
+    types = {int: pa.int64(), float: pa.float64(), bool: pa.bool_(), datetime: pa.timestamp('us')}
+    fields = []
+    for column in export_statement(name).selected_columns:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = str
+        fields.append((column.key, types.get(python_type, pa.string())))
+    return pa.schema(fields)
+
+
+def stream_parquet(name, start=None, end=None, chunk_size=50000):
+    """Parquet bytes with one row group per chunk (requires the pyarrow package)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export needs the pyarrow package')
+
+    schema = _arrow_schema(pa, name)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    for _, rows in iter_chunks(name, start, end, chunk_size):
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+            schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(name, fmt='csv', start=None, end=None, chunk_size=5000):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format {fmt!r}; expected one of {EXPORT_FORMATS}')
+    if name not in EXPORTS:
+        raise ValueError(f'Unknown export {name!r}; expected one of {EXPORTS}')
+    return (stream_csv if fmt == 'csv' else stream_parquet)(name, start, end, chunk_size)
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import DateTime, Integer, and_, case, cast, func, literal, or_, select
+from sqlalchemy.orm import aliased
+from models import db
+from models.job import JobRun
+from models.transaction import Transaction, Fine
+from utils import stats
+
+ACCRUAL_JOB = 'accrue_overdue_fines'
+
+
+def days_overdue(now, due_date):
+    """Whole days from due_date to now in SQL, matching timedelta.days"""
+    now = literal(now, DateTime)
+    if db.engine.dialect.name == 'sqlite':
+        return cast(func.julianday(now) - func.julianday(due_date), Integer)
+    return cast(func.floor(func.extract('epoch', now - due_date) / 86400), Integer)
+
+
+def _candidates(now, last_run):
+    # Loans at least a day overdue. After a previous run only loans that
+    # became overdue since, or crossed another day boundary, can change.
+    conditions = [Transaction.status == 'borrowed', Transaction.due_date <= now - timedelta(days=1)]
+    if last_run is not None:
+        conditions.append(or_(
+            Transaction.due_date > last_run - timedelta(days=1),
+            days_overdue(now, Transaction.due_date) > days_overdue(last_run, Transaction.due_date)
+        ))
+    return conditions
+
+
+def _paid_so_far():
+    # Overdue fines already paid on a loan while it was still out
+    paid = aliased(Fine)
+    return select(func.coalesce(func.sum(paid.amount), 0)).where(
+        paid.transaction_id == Transaction.id, paid.reason == 'overdue', paid.status == 'paid'
+    ).scalar_subquery()
+
+
+def _upsert_statement(conditions, amount, now):
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise RuntimeError(f'Fine accrual needs INSERT ... ON CONFLICT support, not {dialect}')
+
+    rows = select(
+        Transaction.user_id, Transaction.id, amount,
+        literal('overdue'), literal(now, DateTime), literal('unpaid')
+    ).where(*conditions, amount > 0)
+    stmt = insert(Fine.__table__).from_select(
+        ['user_id', 'transaction_id', 'amount', 'reason', 'issue_date', 'status'], rows
+    )
+    # Paid fines are outside the index and left alone; unchanged amounts
+    # aren't rewritten
+    return stmt.on_conflict_do_update(
+        index_elements=['transaction_id'],
+        index_where=and_(Fine.reason == 'overdue', Fine.status == 'unpaid'),
+        set_={'amount': stmt.excluded.amount},
+        where=and_(Fine.status == 'unpaid', Fine.amount != stmt.excluded.amount)
+    )
+
+
+def accrue_overdue_fines(now=None, chunk_size=50000, full=False):
+    """Create or update the overdue fine of every loan still out past its due date.
+
+    Works in set-based INSERT ... SELECT ... ON CONFLICT statements over
+    chunks of about ``chunk_size`` loans, each committed with the matching
+    change to the unpaid_fines counter. Re-running is harmless: amounts only
+    change when another day has passed. A fine paid while the book is still
+    out covers the days up to then; later days go into a new unpaid fine.
+    Returns the number of fines written.
+    """
+    now = now or datetime.utcnow()
+    rate = current_app.config.get('FINE_PER_DAY', 0.50)
+    job = db.session.get(JobRun, ACCRUAL_JOB) or JobRun(name=ACCRUAL_JOB, rows_affected=0)
+    conditions = _candidates(now, None if full else job.last_run_at)
+    amount = func.round(days_overdue(now, Transaction.due_date) * rate - _paid_so_far(), 2)
+
+    # Chunks are due_date ranges, so each one is a range scan of the
+    # (status, due_date) index rather than a pass over every open loan
+    written = 0
+    previous = None
+    while True:
+        window = conditions if previous is None else conditions + [Transaction.due_date > previous]
+        boundary = db.session.execute(
+            select(Transaction.due_date).where(*window)
+            .order_by(Transaction.due_date).offset(chunk_size - 1).limit(1)
+        ).scalar()
+        chunk = window if boundary is None else window + [Transaction.due_date <= boundary]
+
+        new_fines, added_amount = db.session.execute(
+            select(
+                func.sum(case((Fine.id.is_(None), 1), else_=0)),
+                func.sum(amount - func.coalesce(Fine.amount, 0))
+            ).select_from(Transaction).outerjoin(Fine, and_(
+                Fine.transaction_id == Transaction.id, Fine.reason == 'overdue', Fine.status == 'unpaid'
+            )).where(*chunk, or_(Fine.id.is_not(None), amount > 0))
+        ).one()
+        written += db.session.execute(_upsert_statement(chunk, amount, now)).rowcount
+        if new_fines or added_amount:
+            stats.bump('unpaid_fines', new_fines or 0, added_amount or 0.0)
+        db.session.commit()
+        if boundary is None:
+            break
+        previous = boundary
+
+    job.last_run_at = now
+    job.rows_affected = written
+    db.session.add(job)
+    db.session.commit()
+    return written
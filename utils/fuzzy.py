@@ -0,0 +1,310 @@
+import os
+import pickle
+import re
+import threading
+import unicodedata
+import zlib
+from array import array
+from collections import Counter
+from heapq import nlargest
+from flask import current_app
+from sqlalchemy import or_, select
+from models import db
+from models.book import Book
+from utils.profiling import uncounted
+
+SNAPSHOT_FORMAT = 1
+_WORD = re.compile(r'\w+')
+_build_lock = threading.Lock()
+
+
+def words(text):
+    """Lower-cased words of ``text`` with accents stripped"""
+    if not text:
+        return []
+    if not text.isascii():
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return _WORD.findall(text.lower())
+
+
+def trigrams(word):
+    # Padded like pg_trgm, so the start of a word weighs more than its end
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(grams, other):
+    shared = len(grams & other)
+    return shared / (len(grams) + len(other) - shared)
+
+
+def _query_terms(search, max_terms=8):
+    terms = list(dict.fromkeys(words(search)))
+    # One- and two-letter words match half the vocabulary; ignore them
+    # unless there is nothing else to go on
+    longer = [term for term in terms if len(term) > 2]
+    return (longer or terms)[:max_terms]
+
+
+def score_text(term_grams, text):
+    """Mean over the query terms of each one's best similarity to a word of ``text``"""
+    candidates = [trigrams(word) for word in set(words(text))]
+    if not term_grams or not candidates:
+        return 0.0
+    return sum(max(_similarity(grams, other) for other in candidates)
+               for grams in term_grams) / len(term_grams)
+
+
+def _crc(title, author):
+    return zlib.crc32(f'{title}\x1f{author}'.encode())
+
+
+class TrigramIndex:
+    """In-memory trigram index over book titles and authors.
+
+    Every distinct word is indexed once by its trigrams and keeps the ids
+    of the books that use it, so a lookup compares the query with the
+    vocabulary rather than with every book. Scores are the trigram
+    similarity used by pg_trgm: shared / (len(a) + len(b) - shared).
+    """
+
+    def __init__(self, threshold=0.3, max_words=10):
+        self.threshold = threshold
+        self.max_words = max_words
+        self.max_book_id = 0
+        self._word_ids = {}
+        self._word_sizes = array('B')
+        self._word_books = []
+        self._trigram_words = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._word_books)
+
+    def _word_id(self, word):
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            word_id = len(self._word_books)
+            grams = trigrams(word)
+            self._word_ids[word] = word_id
+            self._word_sizes.append(min(len(grams), 255))
+            self._word_books.append(array('l'))
+            for gram in grams:
+                postings = self._trigram_words.get(gram)
+                if postings is None:
+                    postings = self._trigram_words[gram] = array('l')
+                postings.append(word_id)
+        return word_id
+
+    def add(self, book_id, *texts):
+        with self._lock:
+            for word in {word for text in texts for word in words(text)}:
+                self._word_books[self._word_id(word)].append(book_id)
+            self.max_book_id = max(self.max_book_id, book_id)
+
+    def replace(self, book_id, old_texts, new_texts):
+        """Re-index a book whose title or author changed"""
+        old = {word for text in old_texts for word in words(text)}
+        new = {word for text in new_texts for word in words(text)}
+        with self._lock:
+            for word in old - new:
+                word_id = self._word_ids.get(word)
+                if word_id is not None:
+                    try:
+                        self._word_books[word_id].remove(book_id)
+                    except ValueError:
+                        pass
+            for word in new - old:
+                self._word_books[self._word_id(word)].append(book_id)
+
+    def similar_words(self, term):
+        """[(similarity, word_id)] for the vocabulary words closest to ``term``"""
+        grams = trigrams(term)
+        counts = Counter()
+        for gram in grams:
+            postings = self._trigram_words.get(gram)
+            if postings is not None:
+                counts.update(postings)
+        size = len(grams)
+        # shared >= threshold * size holds for every word that can reach
+        # the threshold, so most candidates are dropped before dividing
+        minimum = self.threshold * size
+        sizes = self._word_sizes
+        matches = [(shared / (size + sizes[word_id] - shared), word_id)
+                   for word_id, shared in counts.items() if shared >= minimum]
+        return nlargest(self.max_words, [match for match in matches if match[0] >= self.threshold])
+
+    def search(self, search, limit=100):
+        """Up to ``limit`` (book_id, score) pairs, best first.
+
+        A book scores the mean over the query's words of its closest word's
+        similarity, so books matching every word come before partial matches.
+        """
+        terms = _query_terms(search)
+        if not terms:
+            return []
+        totals = None
+        for term in terms:
+            best = {}
+            # Ascending, so a book keeps its closest word's similarity
+            for similarity, word_id in sorted(self.similar_words(term)):
+                best.update(dict.fromkeys(self._word_books[word_id], similarity))
+            if totals is None:
+                totals = best
+            else:
+                totals = {**totals, **{book_id: similarity + totals.get(book_id, 0.0)
+                                       for book_id, similarity in best.items()}}
+        if len(totals) > limit:
+            # Scores come in few distinct values: find the one the limit
+            # falls on instead of sorting every candidate
+            cutoff, seen = 0.0, 0
+            for score, count in sorted(Counter(totals.values()).items(), reverse=True):
+                cutoff, seen = score, seen + count
+                if seen >= limit:
+                    break
+            totals = {book_id: score for book_id, score in totals.items() if score >= cutoff}
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(book_id, score / len(terms)) for book_id, score in ranked]
+
+    @classmethod
+    def build(cls, threshold=0.3, chunk_size=10000):
+        index = cls(threshold)
+        result = db.session.execute(
+            select(Book.id, Book.title, Book.author).execution_options(yield_per=chunk_size)
+        )
+        for book_id, title, author in result:
+            index.add(book_id, title, author)
+        return index
+
+    def save(self, path):
+        """Write a snapshot, with a checksum per book so loading can catch later edits"""
+        ids, crcs = array('l'), array('L')
+        result = db.session.execute(
+            select(Book.id, Book.title, Book.author).order_by(Book.id).execution_options(yield_per=10000)
+        )
+        for book_id, title, author in result:
+            ids.append(book_id)
+            crcs.append(_crc(title, author))
+        state = {
+            'format': SNAPSHOT_FORMAT,
+            'max_book_id': self.max_book_id,
+            'words': list(self._word_ids),
+            'word_sizes': self._word_sizes,
+            'word_books': self._word_books,
+            'trigram_words': self._trigram_words,
+            'ids': ids,
+            'crcs': crcs,
+        }
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path, threshold=0.3):
+        """Read a snapshot and bring it up to date; None if there is no usable one.
+
+        Books added or edited since the snapshot was written are indexed
+        again. Words an edited book no longer has stay behind until the next
+        snapshot; fuzzy_search re-scores against the current rows, so they
+        cost a little work but never a wrong result.
+        """
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if state.get('format') != SNAPSHOT_FORMAT:
+            return None
+        index = cls(threshold)
+        index._word_ids = {word: word_id for word_id, word in enumerate(state['words'])}
+        index._word_sizes = state['word_sizes']
+        index._word_books = state['word_books']
+        index._trigram_words = state['trigram_words']
+        index.max_book_id = state['max_book_id']
+
+        known = dict(zip(state['ids'], state['crcs']))
+        result = db.session.execute(
+            select(Book.id, Book.title, Book.author).execution_options(yield_per=10000)
+        )
+        for book_id, title, author in result:
+            if known.get(book_id) != _crc(title, author):
+                index.add(book_id, title, author)
+        return index
+
+
+def fuzzy_search_enabled(app=None):
+    return (app or current_app).config.get('SEARCH_FUZZY', True)
+
+
+def snapshot_path(app):
+    return app.config.get('SEARCH_SNAPSHOT') or os.path.join(app.instance_path, 'search-trigrams.pickle')
+
+
+def catalog_index(app=None):
+    """This worker's index, loaded from the snapshot or built on first use"""
+    app = app or current_app._get_current_object()
+    index = app.extensions.get('trigram_index')
+    if index is None:
+        with _build_lock:
+            index = app.extensions.get('trigram_index')
+            if index is None:
+                threshold = app.config.get('SEARCH_FUZZY_THRESHOLD', 0.3)
+                # Once per worker (warmup normally does it), so it isn't
+                # charged to the request that happens to need it first
+                with uncounted():
+                    index = TrigramIndex.load(snapshot_path(app), threshold) \
+                        or TrigramIndex.build(threshold)
+                app.extensions['trigram_index'] = index
+    return index
+
+
+def index_book(book_id, title, author, previous=None):
+    """Keep the index in step with an added or edited book.
+
+    ``previous`` is the book's (title, author) before an edit. Does nothing
+    until the index has been built; building reads the current rows anyway.
+    """
+    index = current_app.extensions.get('trigram_index')
+    if index is None:
+        return
+    if previous is None:
+        index.add(book_id, title, author)
+    else:
+        index.replace(book_id, previous, (title, author))
+
+
+def fuzzy_search(search, category=None, limit=12):
+    """Books closest to ``search``, best first, optionally in one category.
+
+    The index proposes candidates from this worker's in-memory copy. One
+    query fetches them together with the next SEARCH_FUZZY_SYNC_BATCH books
+    added since the index last saw one (by another worker or an import,
+    say), which are indexed on the way, so a large import is caught up over
+    several searches; all of them are then ranked on their current title
+    and author.
+
+    Edits made in another worker only reach this index when it is next
+    loaded, i.e. at this worker's restart. Until then such a book is still
+    found by its old words, and then dropped if its current title and
+    author no longer match, but not by its new ones.
+    """
+    index = catalog_index()
+    candidates = index.search(search, current_app.config.get('SEARCH_FUZZY_CANDIDATES', 100))
+    seen = index.max_book_id
+    added = select(Book.id).where(Book.id > seen).order_by(Book.id).limit(
+        current_app.config.get('SEARCH_FUZZY_SYNC_BATCH', 1000))
+    books = Book.query.filter(or_(
+        Book.id.in_([book_id for book_id, _ in candidates]),
+        Book.id.in_(added)
+    )).all()
+    for book in books:
+        if book.id > seen:
+            index.add(book.id, book.title, book.author)
+
+    term_grams = [trigrams(term) for term in _query_terms(search)]
+    scored = [(score_text(term_grams, f'{book.title} {book.author}'), book) for book in books
+              if not category or book.category == category]
+    scored = [item for item in scored if item[0] >= index.threshold]
+    scored.sort(key=lambda item: (-item[0], item[1].title, item[1].id))
+    return [book for _, book in scored[:limit]]
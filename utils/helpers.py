@@ -0,0 +1,75 @@
+from sqlalchemy import update
+from models import db
+
+
+def upsert_increment(model, keys, increments):
+    """Atomically add ``increments`` to the row identified by ``keys``,
+    inserting it with the increments as initial values if it doesn't exist.
+    Runs in the caller's session transaction.
+    """
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(**keys, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + stmt.excluded[name] for name in increments}
+        )
+        db.session.execute(stmt)
+        return
+
+    stmt = update(table).values(
+        **{name: table.c[name] + value for name, value in increments.items()}
+    )
+    for name, value in keys.items():
+        stmt = stmt.where(table.c[name] == value)
+    if db.session.execute(stmt).rowcount == 0:
+        db.session.execute(table.insert().values(**keys, **increments))
+
+
+def upsert_increment_many(model, rows, increments):
+    """upsert_increment() for many rows in one executemany; ``rows`` are key dicts"""
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        for keys in rows:
+            upsert_increment(model, keys, increments)
+        return
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(rows[0]),
+        set_={name: table.c[name] + stmt.excluded[name] for name in increments}
+    )
+    db.session.execute(stmt, [dict(keys, **increments) for keys in rows])
+
+
+def upsert_increment_from_select(model, columns, counter, rows):
+    """Add the last column of each row of the SELECT ``rows`` to ``counter``
+    on the row keyed by the other ``columns``, inserting missing rows
+    """
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        for *keys, value in db.session.execute(rows):
+            upsert_increment(model, dict(zip(columns, keys)), {counter: value})
+        return
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    stmt = insert(table).from_select(list(columns) + [counter], rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(columns),
+        set_={counter: table.c[counter] + stmt.excluded[counter]}
+    )
+    db.session.execute(stmt)
@@ -0,0 +1,101 @@
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import db
+from models.user import User
+from utils.cache import Cache, LRUCacheBackend, NullCacheBackend, cache
+
+# Columns copied into the snapshot; changing any of them on a User drops
+# that user's cached entry once the change commits
+SNAPSHOT_FIELDS = ('id', 'username', 'role', 'first_name', 'last_name', 'is_active')
+
+identity_cache = Cache(prefix='identity')
+_listening = False
+
+
+class UserSnapshot(UserMixin):
+    """The logged-in user as requests see it: plain values, no session attached"""
+
+    def __init__(self, id, username, role, first_name, last_name, is_active):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.first_name = first_name
+        self.last_name = last_name
+        self._active = is_active
+
+    @property
+    def is_active(self):
+        return bool(self._active)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
+
+
+def _snapshot(user_id):
+    # Runs as a cache fill, so from the primary: a snapshot read off a
+    # lagging replica right after invalidate_user would bring the old role back
+    row = db.session.query(*[getattr(User, field) for field in SNAPSHOT_FIELDS]).filter(
+        User.id == user_id
+    ).first()
+    return dict(row._mapping) if row else None
+
+
+def load_identity(user_id):
+    """user_loader for Flask-Login: a cached UserSnapshot, or None"""
+    data = identity_cache.get_or_set(f'user:{user_id}', user_id, lambda: _snapshot(user_id))
+    return UserSnapshot(**data) if data else None
+
+
+def invalidate_user(*user_ids):
+    """Drop cached identities; needed after bulk UPDATEs that bypass the ORM"""
+    identity_cache.bump(*[f'user:{user_id}' for user_id in user_ids])
+
+
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault('identity_changed', set())
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in SNAPSHOT_FIELDS):
+                changed.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            changed.add(obj.id)
+
+
+def _invalidate_after_commit(session):
+    changed = session.info.pop('identity_changed', None)
+    if changed:
+        invalidate_user(*changed)
+
+
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop('identity_changed', None)
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        event.listen(Session, 'after_flush', _collect_changed_users)
+        event.listen(Session, 'after_commit', _invalidate_after_commit)
+        event.listen(Session, 'after_soft_rollback', _discard_after_rollback)
+        _listening = True
+
+
+def init_identity_cache(app):
+    """Cache login identities next to the content cache.
+
+    With the redis backend the identity cache shares it, so a role change
+    is seen by every worker at once; otherwise it gets its own bounded LRU.
+    """
+    _listen()
+    if app.config.get('CACHE_BACKEND', 'lru') == 'redis':
+        identity_cache.backend = cache.backend
+    elif app.config.get('IDENTITY_CACHE_MAX_ENTRIES', 10000):
+        identity_cache.backend = LRUCacheBackend(app.config.get('IDENTITY_CACHE_MAX_ENTRIES', 10000))
+    else:
+        identity_cache.backend = NullCacheBackend()
+    identity_cache.default_ttl = app.config.get('IDENTITY_CACHE_TTL', 300)
+    app.extensions['identity_cache'] = identity_cache
+    return identity_cache
@@ -0,0 +1,254 @@
+import csv
+import json
+import os
+import re
+import time
+from datetime import datetime
+from sqlalchemy import and_, case, select
+from models import db
+from models.book import Book
+from utils import stats
+from utils.cache import cache
+from utils.fuzzy import index_book
+from utils.inventory import CIRCULATING_STATUSES
+
+IMPORT_FORMATS = ('csv', 'jsonl', 'marc')
+
+# Column limits from models/book.py, checked up front so one bad row
+# can't fail a whole batch
+REQUIRED_FIELDS = ('title', 'author', 'isbn', 'category')
+MAX_LENGTHS = {'title': 200, 'author': 100, 'isbn': 20, 'category': 50,
+               'publisher': 100, 'location': 50}
+
+# MARC-lite: one "TAG value" line per field ("=245  $aTitle" mnemonic
+# lines work too), records separated by a blank line
+MARC_FIELDS = {
+    '020': ('isbn', 'a'),
+    '100': ('author', 'a'),
+    '245': ('title', 'a'),
+    '260': ('publisher', 'b'),
+    '264': ('publisher', 'b'),
+    '520': ('description', 'a'),
+    '650': ('category', 'a'),
+    '852': ('location', 'h'),
+    '949': ('total_copies', 'c'),
+}
+
+
+class ImportReport:
+    def __init__(self, max_errors=1000):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        # Rows whose ISBN came up again later in the file; the last one wins
+        self.duplicates = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.started = time.perf_counter()
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl',
+            'mrk': 'marc', 'marc': 'marc', 'txt': 'marc'}.get(extension)
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(stream):
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f'invalid JSON: {e}')
+            continue
+        yield line_number, record if isinstance(record, dict) else ValueError('not a JSON object')
+
+
+def _subfield(value, code):
+    if '$' not in value:
+        return value.strip()
+    for part in value.split('$')[1:]:
+        if part[:1] == code:
+            return part[1:].strip().rstrip(' /:;,.')
+    return None
+
+
+def read_marc(stream):
+    record, start = {}, None
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            if record:
+                yield start, record
+            record, start = {}, None
+            continue
+        start = start or line_number
+        tag, _, value = line.lstrip('=').partition(' ')
+        if tag in MARC_FIELDS:
+            field, code = MARC_FIELDS[tag]
+            text = _subfield(value.strip(), code)
+            if text and field not in record:
+                record[field] = text
+            if tag in ('260', '264') and 'publication_year' not in record:
+                year = re.search(r'\d{4}', _subfield(value, 'c') or '')
+                if year:
+                    record['publication_year'] = year.group()
+    if record:
+        yield start, record
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'marc': read_marc}
+
+
+def _optional_int(value, name, minimum=None):
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f'{name} must be a whole number')
+    if minimum is not None and number < minimum:
+        raise ValueError(f'{name} must be at least {minimum}')
+    return number
+
+
+def validate_row(record):
+    """Turn a raw record into column values for books, or raise ValueError"""
+    row = {}
+    for field in ('title', 'author', 'isbn', 'category', 'publisher', 'location', 'description'):
+        value = record.get(field)
+        value = str(value).strip() if value is not None else ''
+        if field in REQUIRED_FIELDS and not value:
+            raise ValueError(f'{field} is required')
+        if field in MAX_LENGTHS and len(value) > MAX_LENGTHS[field]:
+            raise ValueError(f'{field} is longer than {MAX_LENGTHS[field]} characters')
+        row[field] = value or None
+    row['publication_year'] = _optional_int(record.get('publication_year'), 'publication_year')
+    copies = _optional_int(record.get('total_copies', record.get('copies')), 'total_copies', 1)
+    row['total_copies'] = copies or 1
+    return row
+
+
+def _upsert_statement():
+    table = Book.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise RuntimeError(f'Bulk import needs INSERT ... ON CONFLICT support, not {dialect}')
+
+    stmt = insert(table)
+    excluded = stmt.excluded
+    # Changing total_copies moves available_copies by the same amount, so
+    # copies currently on loan stay accounted for. Status only follows when
+    # availability changes, and never replaces a librarian's 'lost' or
+    # 'repair'.
+    available = table.c.available_copies + excluded.total_copies - table.c.total_copies
+    clamped = case((available > 0, available), else_=0)
+    return stmt.on_conflict_do_update(
+        index_elements=['isbn'],
+        set_={
+            'title': excluded.title,
+            'author': excluded.author,
+            'category': excluded.category,
+            'publisher': excluded.publisher,
+            'publication_year': excluded.publication_year,
+            'location': excluded.location,
+            'description': excluded.description,
+            'total_copies': excluded.total_copies,
+            'available_copies': clamped,
+            'status': case(
+                (and_(*[table.c.status != status for status in CIRCULATING_STATUSES]), table.c.status),
+                (clamped == table.c.available_copies, table.c.status),
+                (available > 0, 'available'),
+                else_='checked_out'
+            ),
+            'version': table.c.version + 1,
+        }
+    )
+
+
+def _flush_batch(batch, report, seen):
+    # Later rows for the same ISBN win, as they would row by row
+    rows = list({row['isbn']: row for row in batch}.values())
+    repeated = sum(1 for row in rows if row['isbn'] in seen)
+    report.duplicates += len(batch) - len(rows) + repeated
+    seen.update(row['isbn'] for row in rows)
+    existing = {isbn: (book_id, title, author) for isbn, book_id, title, author in db.session.execute(
+        select(Book.isbn, Book.id, Book.title, Book.author).where(Book.isbn.in_([row['isbn'] for row in rows]))
+    )}
+    now = datetime.utcnow()
+    for row in rows:
+        row.update(available_copies=row['total_copies'], status='available', created_date=now)
+
+    db.session.execute(_upsert_statement(), rows)
+    inserted = len(rows) - len(existing)
+    if inserted:
+        stats.record_book_added(inserted)
+    db.session.commit()
+    cache.bump(*[f'book:{book_id}' for book_id, _, _ in existing.values()])
+    # New books reach each worker's fuzzy index over its next searches
+    for row in rows:
+        if row['isbn'] in existing:
+            book_id, title, author = existing[row['isbn']]
+            index_book(book_id, row['title'], row['author'], previous=(title, author))
+
+    report.inserted += inserted
+    # An ISBN an earlier batch of this file wrote already counts as a duplicate
+    report.updated += len(existing) - repeated
+
+
+def import_books(stream, fmt, batch_size=1000, max_errors=1000):
+    """Stream book records from ``stream`` and upsert them by ISBN.
+
+    Rows are validated one by one and written in batches, each batch one
+    executemany and one commit, so memory use doesn't grow with the file.
+    """
+    if fmt not in READERS:
+        raise ValueError(f'Unknown import format {fmt!r}; expected one of {IMPORT_FORMATS}')
+
+    report = ImportReport(max_errors)
+    batch = []
+    # ISBNs written so far, to tell duplicates in the file from updates
+    seen = set()
+    for line, record in READERS[fmt](stream):
+        report.rows += 1
+        if isinstance(record, Exception):
+            report.error(line, str(record))
+            continue
+        try:
+            batch.append(validate_row(record))
+        except ValueError as e:
+            report.error(line, str(e))
+            continue
+        if len(batch) >= batch_size:
+            _flush_batch(batch, report, seen)
+            batch = []
+    if batch:
+        _flush_batch(batch, report, seen)
+
+    cache.bump('catalog', 'categories')
+    return report
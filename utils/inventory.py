@@ -0,0 +1,130 @@
+from datetime import datetime
+from sqlalchemy import and_, bindparam, func, select
+from models import db
+from models.book import Book
+from models.job import JobRun
+from models.transaction import Transaction
+from utils.cache import cache
+
+INVENTORY_JOB = 'reconcile_inventory'
+# The statuses circulation moves a book between; anything else (a
+# librarian's 'lost' or 'repair', say) is left alone
+CIRCULATING_STATUSES = ('available', 'checked_out')
+
+
+class InventoryReport:
+    def __init__(self, max_samples=20):
+        self.checked = 0
+        self.drifted = 0
+        self.repaired = 0
+        # Borrowed or returned between the check and the repair; the next
+        # run looks at them again
+        self.skipped = 0
+        # More open loans than copies, so availability is clamped to 0
+        self.oversubscribed = 0
+        self.samples = []
+        self.max_samples = max_samples
+
+    def drift(self, row):
+        self.drifted += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append(row)
+
+
+def expected_availability(after_id=0, up_to_id=None):
+    """Stored and expected availability for books after_id < id <= up_to_id.
+
+    One grouped query: each book's row joined to its open loans through
+    the (book_id, status) index, so a chunk reads no other loans.
+    """
+    table = Book.__table__
+    conditions = [table.c.id > after_id]
+    if up_to_id is not None:
+        conditions.append(table.c.id <= up_to_id)
+    open_loans = func.count(Transaction.id)
+    return select(
+        table.c.id, table.c.total_copies, table.c.available_copies, table.c.status, open_loans
+    ).select_from(table).outerjoin(Transaction, and_(
+        Transaction.book_id == table.c.id, Transaction.status == 'borrowed'
+    )).where(*conditions).group_by(table.c.id).order_by(table.c.id)
+
+
+def _expected(total, available, status, open_loans):
+    expected = (total or 0) - open_loans
+    new_status = status
+    if status in CIRCULATING_STATUSES:
+        new_status = 'available' if expected > 0 else 'checked_out'
+    return max(expected, 0), new_status
+
+
+def _repair_statement():
+    # Compare-and-set on the values just read: a borrow or return that
+    # commits in between changes available_copies, and then the row is
+    # left for the next run rather than overwritten with a stale count
+    table = Book.__table__
+    return table.update().where(
+        table.c.id == bindparam('b_id'),
+        table.c.available_copies.is_not_distinct_from(bindparam('seen_available')),
+        table.c.total_copies.is_not_distinct_from(bindparam('seen_total')),
+    ).values(
+        available_copies=bindparam('expected'),
+        status=bindparam('new_status'),
+        version=table.c.version + 1,
+    )
+
+
+def reconcile_inventory(repair=True, chunk_size=5000, now=None):
+    """Check Book.available_copies and status against total_copies - open loans.
+
+    Walks the books by id, one grouped query per chunk of ``chunk_size``,
+    and repairs each drifted row with its own compare-and-set update. Every
+    chunk commits separately, so writers are never held up for longer than
+    one chunk's repairs. With ``repair=False`` it only reports. Returns an
+    InventoryReport.
+    """
+    now = now or datetime.utcnow()
+    report = InventoryReport()
+    statement = _repair_statement()
+    repaired_ids = []
+    last_id = 0
+    while True:
+        up_to_id = db.session.execute(
+            select(Book.id).where(Book.id > last_id).order_by(Book.id).offset(chunk_size - 1).limit(1)
+        ).scalar()
+        rows = db.session.execute(expected_availability(last_id, up_to_id)).all()
+        if not rows:
+            break
+
+        for book_id, total, available, status, open_loans in rows:
+            report.checked += 1
+            expected, new_status = _expected(total, available, status, open_loans)
+            if expected == available and new_status == status:
+                continue
+            report.drift((book_id, available, expected, status, new_status))
+            if (total or 0) < open_loans:
+                report.oversubscribed += 1
+            if not repair:
+                continue
+            updated = db.session.execute(statement, {
+                'b_id': book_id, 'seen_available': available, 'seen_total': total,
+                'expected': expected, 'new_status': new_status,
+            }).rowcount
+            if updated:
+                report.repaired += 1
+                repaired_ids.append(book_id)
+            else:
+                report.skipped += 1
+        db.session.commit()
+        if up_to_id is None:
+            break
+        last_id = up_to_id
+
+    if repair:
+        if repaired_ids:
+            cache.bump('catalog', *[f'book:{book_id}' for book_id in repaired_ids])
+        job = db.session.get(JobRun, INVENTORY_JOB) or JobRun(name=INVENTORY_JOB)
+        job.last_run_at = now
+        job.rows_affected = report.repaired
+        db.session.add(job)
+        db.session.commit()
+    return report
@@ -0,0 +1,81 @@
+from sqlalchemy import inspect, text
+from models import db
+from utils.search import create_search_index
+from utils.stats import reconcile_stats, rebuild_daily_stats
+from models.stats import LibraryCounter, BookDailyStat
+from models.transaction import LoanRecord
+
+
+def create_missing_indexes():
+    """Create indexes declared on the models that an existing database lacks.
+
+    db.create_all() only creates indexes together with new tables, so
+    databases created before an index was declared need this step.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+    return created
+
+
+def add_missing_columns():
+    """Add columns declared on the models that an existing table lacks.
+
+    Only for columns that are nullable or have a server default, which is
+    what ALTER TABLE ... ADD COLUMN can do on every backend.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}'
+            if column.server_default is not None:
+                default = column.server_default.arg
+                ddl += f" DEFAULT '{default}'" if isinstance(default, str) else f' DEFAULT {default.text}'
+            if not column.nullable:
+                ddl += ' NOT NULL'
+            with db.engine.begin() as conn:
+                conn.execute(text(ddl))
+            added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def widen_columns():
+    # users.password_hash went from 128 to 256 characters to fit scrypt
+    # hashes; SQLite ignores VARCHAR lengths, PostgreSQL needs the ALTER
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE users ALTER COLUMN password_hash TYPE VARCHAR(256)'))
+
+
+def upgrade_database():
+    """Bring a database created by any earlier version up to the current schema"""
+    db.create_all()
+    add_missing_columns()
+    created = create_missing_indexes()
+    widen_columns()
+    create_search_index()
+    if LibraryCounter.query.first() is None:
+        reconcile_stats()
+    elif BookDailyStat.query.first() is None and LoanRecord.query.first() is not None:
+        # Leaderboard buckets arrived after this database had loans
+        rebuild_daily_stats()
+        db.session.commit()
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.begin() as conn:
+            conn.execute(text('PRAGMA optimize'))
+    return created
@@ -0,0 +1,294 @@
+import json
+import os
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from itertools import groupby
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+from werkzeug.utils import import_string
+from models import db
+from models.book import Book
+from models.notification import Notification
+from models.transaction import Transaction, Reservation
+
+# kind: (subject, line template filled from the payload)
+MESSAGES = {
+    'reservation_ready': ('Your reserved book is available',
+                          '"{title}" is back and waiting for you at the desk.'),
+    'due_reminder': ('Books due soon', '"{title}" is due back on {due_date}.'),
+}
+
+
+class NullTransport:
+    """Drops every message"""
+
+    def send(self, messages):
+        return {}
+
+
+class FileTransport:
+    """Appends messages to a JSON-lines file, standing in for a mail server"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, messages):
+        with self._lock, open(self.path, 'a') as f:
+            for message in messages:
+                f.write(json.dumps(message) + '\n')
+        return {}
+
+
+class SMTPTransport:
+    def __init__(self, host, port=25, sender='library@localhost', username=None,
+                 password=None, use_tls=False):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+
+    def send(self, messages):
+        # One connection per batch; a refused recipient only fails its own message
+        failures = {}
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            for index, message in enumerate(messages):
+                email = EmailMessage()
+                email['From'] = self.sender
+                email['To'] = message['to']
+                email['Subject'] = message['subject']
+                email.set_content(message['body'])
+                try:
+                    smtp.send_message(email)
+                except smtplib.SMTPException as e:
+                    failures[index] = str(e)
+        return failures
+
+
+def _insert_ignoring_duplicates(rows):
+    table = Notification.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        db.session.execute(insert(table).on_conflict_do_nothing(index_elements=['dedup_key']), rows)
+        return
+
+    existing = set(db.session.execute(
+        select(table.c.dedup_key).where(table.c.dedup_key.in_([row['dedup_key'] for row in rows]))
+    ).scalars())
+    rows = [row for row in rows if row['dedup_key'] not in existing]
+    if rows:
+        db.session.execute(table.insert(), rows)
+
+
+def _row(user_id, kind, dedup_key, payload, now):
+    return {'user_id': user_id, 'kind': kind, 'dedup_key': dedup_key,
+            'payload': json.dumps(payload, default=str), 'status': 'pending',
+            'attempts': 0, 'next_attempt_at': now, 'created_at': now}
+
+
+def notify_reservation_holders(book_ids):
+    """Queue a 'book is back' notice for each book's longest-waiting reservation"""
+    waiting = db.session.query(Reservation, Book.title).join(
+        Book, Book.id == Reservation.book_id
+    ).filter(
+        Reservation.book_id.in_(book_ids),
+        Reservation.status == 'active',
+        Reservation.notification_sent.is_(False)
+    ).order_by(Reservation.book_id, Reservation.reserve_date, Reservation.id)
+    now = datetime.utcnow()
+    rows = [
+        _row(reservation.user_id, 'reservation_ready', f'reservation_ready:{reservation.id}',
+             {'reservation_id': reservation.id, 'book_id': book_id, 'title': title}, now)
+        for book_id, group in groupby(waiting, key=lambda row: row[0].book_id)
+        for reservation, title in [next(group)]
+    ]
+    if rows:
+        _insert_ignoring_duplicates(rows)
+
+
+def queue_due_reminders(now=None, days_ahead=None, batch_size=1000):
+    """Queue one reminder per member listing all their loans due soon.
+
+    Keyed by member and day, so running it more than once a day is harmless.
+    Returns the number of members queued.
+    """
+    now = now or datetime.utcnow()
+    if days_ahead is None:
+        days_ahead = current_app.config.get('DUE_REMINDER_DAYS', 2)
+    loans = db.session.query(
+        Transaction.user_id, Transaction.id, Transaction.due_date, Book.title
+    ).join(Book, Book.id == Transaction.book_id).filter(
+        Transaction.status == 'borrowed',
+        Transaction.due_date > now,
+        Transaction.due_date <= now + timedelta(days=days_ahead)
+    ).order_by(Transaction.user_id, Transaction.due_date)
+
+    rows, queued = [], 0
+    for user_id, user_loans in groupby(loans, key=lambda loan: loan.user_id):
+        items = [{'transaction_id': loan.id, 'title': loan.title,
+                  'due_date': loan.due_date.strftime('%Y-%m-%d')} for loan in user_loans]
+        rows.append(_row(user_id, 'due_reminder', f'due_reminder:{user_id}:{now:%Y-%m-%d}',
+                         {'loans': items}, now))
+        if len(rows) >= batch_size:
+            _insert_ignoring_duplicates(rows)
+            queued += len(rows)
+            rows = []
+    if rows:
+        _insert_ignoring_duplicates(rows)
+        queued += len(rows)
+    db.session.commit()
+    return queued
+
+
+def render_message(user, notifications):
+    """Combine one member's pending notifications into a single message"""
+    lines = []
+    for notification in notifications:
+        payload = json.loads(notification.payload)
+        template = MESSAGES[notification.kind][1]
+        for item in payload.get('loans', [payload]):
+            lines.append(template.format(**item))
+    kinds = {notification.kind for notification in notifications}
+    subject = MESSAGES[kinds.pop()][0] if len(kinds) == 1 else 'Library notifications'
+    body = f'Hello {user.first_name},\n\n' + '\n'.join(lines) + '\n\n- The Library\n'
+    return {'to': user.email, 'subject': subject, 'body': body,
+            'notification_ids': [notification.id for notification in notifications]}
+
+
+def retry_delay(attempts):
+    return timedelta(minutes=min(2 ** attempts, 60))
+
+
+def deliver_pending(batch_size=100, now=None, transport=None):
+    """Send one batch from the outbox; returns the number of notifications sent.
+
+    A batch is claimed by pushing next_attempt_at out by a lease, so other
+    workers skip it and a crashed worker's batch is retried once the lease
+    runs out. Delivery is at least once. Failures back off exponentially
+    until NOTIFICATION_MAX_ATTEMPTS, then stay 'failed'.
+    """
+    now = now or datetime.utcnow()
+    config = current_app.config
+    transport = transport or current_app.extensions['notifications']
+    lease = timedelta(seconds=config.get('NOTIFICATION_LEASE_SECONDS', 300))
+    max_attempts = config.get('NOTIFICATION_MAX_ATTEMPTS', 5)
+
+    ids = db.session.execute(
+        select(Notification.id).where(
+            Notification.status == 'pending', Notification.next_attempt_at <= now
+        ).order_by(Notification.next_attempt_at).limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+    claimed = db.session.execute(
+        update(Notification).where(
+            Notification.id.in_(ids),
+            Notification.status == 'pending',
+            Notification.next_attempt_at <= now
+        ).values(
+            next_attempt_at=now + lease,
+            attempts=Notification.attempts + 1
+        ).returning(Notification.id).execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.session.commit()
+    if not claimed:
+        return 0
+
+    pending = Notification.query.options(joinedload(Notification.user)).filter(
+        Notification.id.in_(claimed)
+    ).order_by(Notification.user_id, Notification.id).all()
+    batches = [list(group) for _, group in groupby(pending, key=lambda n: n.user_id)]
+    messages = [render_message(group[0].user, group) for group in batches]
+    try:
+        failures = transport.send(messages)
+    except Exception as e:
+        failures = {index: str(e) for index in range(len(messages))}
+
+    sent = 0
+    for index, group in enumerate(batches):
+        for notification in group:
+            if index in failures:
+                notification.last_error = failures[index][:1000]
+                if notification.attempts >= max_attempts:
+                    notification.status = 'failed'
+                else:
+                    notification.next_attempt_at = now + retry_delay(notification.attempts)
+                continue
+            notification.status = 'sent'
+            notification.sent_at = now
+            notification.last_error = None
+            sent += 1
+            if notification.kind == 'reservation_ready':
+                reservation_id = json.loads(notification.payload)['reservation_id']
+                db.session.execute(
+                    update(Reservation).where(Reservation.id == reservation_id)
+                    .values(notification_sent=True)
+                )
+    db.session.commit()
+    return sent
+
+
+def run_workers(app, workers=2, batch_size=100, interval=5.0, stop=None):
+    """Drain the outbox from a pool of daemon threads until ``stop`` is set"""
+    stop = stop or threading.Event()
+
+    def work():
+        while not stop.is_set():
+            with app.app_context():
+                try:
+                    sent = deliver_pending(batch_size)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Notification delivery failed')
+                    sent = 0
+            if not sent:
+                stop.wait(interval)
+
+    threads = [threading.Thread(target=work, name=f'notifications-{i}', daemon=True)
+               for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads, stop
+
+
+def _build_transport(app):
+    config = app.config
+    name = config.get('NOTIFICATION_TRANSPORT', 'file')
+    if name == 'smtp':
+        return SMTPTransport(
+            config.get('SMTP_HOST', 'localhost'), config.get('SMTP_PORT', 25),
+            sender=config.get('NOTIFICATION_SENDER', 'library@localhost'),
+            username=config.get('SMTP_USERNAME'), password=config.get('SMTP_PASSWORD'),
+            use_tls=config.get('SMTP_USE_TLS', False)
+        )
+    if name == 'file':
+        path = config.get('NOTIFICATION_FILE') or os.path.join(app.instance_path, 'notifications.jsonl')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return FileTransport(path)
+    if name == 'null':
+        return NullTransport()
+    return import_string(name)()
+
+
+def init_notifications(app, transport=None):
+    """Set up delivery through ``transport`` or the one NOTIFICATION_TRANSPORT names.
+
+    'file' (default), 'smtp', 'null', or a 'module:Class' import path for a
+    custom transport built without arguments.
+    """
+    transport = transport or _build_transport(app)
+    app.extensions['notifications'] = transport
+    return transport
@@ -0,0 +1,143 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from flask import current_app, request
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """One page of a cursor-paginated query.
+
+    Mirrors the parts of Flask-SQLAlchemy's Pagination the templates use,
+    but navigates with opaque next/prev tokens instead of page numbers, so
+    every page costs the same as the first one.
+    """
+    is_keyset = True
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    # Anything else would be bound into the keyset filter as is
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError('cursor values must be strings, numbers or dates')
+    return value
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'k': [_dump_value(v) for v in values], 'd': direction},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size=None):
+    """Return (values, direction), or (None, 'next') for a missing or bad token.
+
+    With ``size`` a token must hold exactly that many key values.
+    """
+    if not token:
+        return None, 'next'
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(payload, dict) or not isinstance(payload.get('k'), list):
+            return None, 'next'
+        if size is not None and len(payload['k']) != size:
+            return None, 'next'
+        direction = 'prev' if payload.get('d') == 'prev' else 'next'
+        return [_load_value(v) for v in payload['k']], direction
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return None, 'next'
+
+
+def _after(columns, values, descending):
+    # (c1, c2, ...) > (v1, v2, ...) expanded so it works on every backend
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=20, descending=False,
+                    with_total=False):
+    """Paginate ``query`` on ``columns``, which must end in a unique column.
+
+    The query's own ORDER BY is replaced by the key columns. The exact total
+    is only counted when ``with_total`` is set.
+    """
+    values, direction = decode_cursor(cursor, len(columns))
+    backwards = direction == 'prev' and values is not None
+    reverse = descending != backwards
+
+    total = query.order_by(None).count() if with_total else None
+
+    page_query = query.order_by(None).order_by(
+        *[column.desc() if reverse else column.asc() for column in columns]
+    )
+    if values is not None:
+        page_query = page_query.filter(_after(columns, values, reverse))
+
+    rows = page_query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+
+    if backwards:
+        items.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = values is not None, has_more
+
+    def key(item):
+        return [getattr(item, column.key) for column in columns]
+
+    next_cursor = encode_cursor(key(items[-1]), 'next') if items and has_next else None
+    prev_cursor = encode_cursor(key(items[0]), 'prev') if items and has_prev else None
+    return KeysetPage(items, next_cursor, prev_cursor, total)
+
+
+def paginate_query(query, columns, per_page, descending=False, with_total=False, keyset=True,
+                   total=None):
+    """Paginate the current request's listing in the configured mode.
+
+    A ``cursor`` argument always selects keyset pagination; otherwise
+    PAGINATION_MODE decides between keyset and classic page numbers.
+    ``keyset=False`` keeps a query on page numbers regardless, for an order
+    the key columns can't reproduce, such as search relevance. Page numbers
+    need the total, which is counted unless ``total`` is a cheaper function
+    returning it.
+    """
+    cursor = request.args.get('cursor')
+    if keyset and (cursor or current_app.config.get('PAGINATION_MODE') == 'keyset'):
+        return keyset_paginate(query, columns, cursor, per_page, descending, with_total)
+
+    page = request.args.get('page', 1, type=int)
+    pagination = query.paginate(page=page, per_page=per_page, error_out=False, count=total is None)
+    if total is not None:
+        pagination.total = total()
+    return pagination
@@ -0,0 +1,110 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """No hashing slot freed up in time; the caller should ask the user to retry"""
+
+
+class PasswordHasher:
+    """Runs password hashing off the request thread with bounded concurrency.
+
+    At most ``workers`` hashes run at once and ``max_pending`` more may
+    wait; a request that can't get a slot within ``wait`` seconds gets
+    HashingBusy instead of piling up, so a login storm is limited to the
+    hashing workers and the rest of the app keeps its CPU. The executor is
+    'thread' (hashlib releases the GIL while hashing), 'process' or 'inline'.
+    """
+
+    def __init__(self, method='pbkdf2:sha256:600000', executor='thread', workers=2,
+                 max_pending=32, wait=5.0):
+        self.method = method
+        self.executor_type = executor
+        self.workers = workers
+        self.wait = wait
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.executor_type == 'process':
+                    # Never fork: the web worker already runs other threads, and a
+                    # forked child could inherit a lock one of them was holding
+                    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                    self._executor = ProcessPoolExecutor(
+                        self.workers, mp_context=multiprocessing.get_context(method))
+                else:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+            return self._executor
+
+    def _run(self, fn, *args, wait=None):
+        if self.executor_type == 'inline':
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.wait if wait is None else wait):
+            self.rejected += 1
+            raise HashingBusy('Too many sign-ins in progress')
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password, wait=None):
+        return self._run(generate_password_hash, password, self.method, wait=wait)
+
+    def verify(self, password_hash, password, wait=None):
+        return self._run(check_password_hash, password_hash, password, wait=wait)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with other parameters than ``method``"""
+        stored = password_hash.split('$', 1)[0]
+        # A method without parameters ('scrypt') accepts any of its own costs
+        return stored != self.method and not stored.startswith(self.method + ':')
+
+    def warmup(self):
+        """Start the workers now rather than on the first sign-in"""
+        if self.executor_type == 'inline':
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(abs, 0) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+hasher = PasswordHasher(executor='inline')
+
+
+def hash_password(password, wait=None):
+    return hasher.hash(password, wait)
+
+
+def verify_password(password_hash, password, wait=None):
+    return hasher.verify(password_hash, password, wait)
+
+
+def needs_rehash(password_hash):
+    return hasher.needs_rehash(password_hash)
+
+
+def init_passwords(app):
+    global hasher
+    config = app.config
+    hasher.shutdown()
+    hasher = PasswordHasher(
+        method=config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'),
+        executor=config.get('PASSWORD_HASH_EXECUTOR', 'thread'),
+        workers=config.get('PASSWORD_HASH_WORKERS', 2),
+        max_pending=config.get('PASSWORD_HASH_MAX_PENDING', 32),
+        wait=config.get('PASSWORD_HASH_WAIT_SECONDS', 5.0),
+    )
+    app.extensions['password_hasher'] = hasher
+    return hasher
@@ -0,0 +1,100 @@
+import threading
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+_listening = False
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+
+def _active_counters():
+    if not hasattr(_local, 'counters'):
+        _local.counters = []
+    return _local.counters
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'paused', False):
+        return
+    for counter in _active_counters():
+        counter.count += 1
+        counter.statements.append(statement)
+    if has_request_context():
+        g.sql_query_count = g.get('sql_query_count', 0) + 1
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        _listening = True
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements executed on this thread inside the block"""
+    _listen()
+    counter = QueryCounter()
+    _active_counters().append(counter)
+    try:
+        yield counter
+    finally:
+        _active_counters().remove(counter)
+
+
+@contextmanager
+def uncounted():
+    """Leave the statements inside the block out of every count and budget.
+
+    For one-off work a request may happen to trigger, such as loading a
+    per-worker cache on its first use.
+    """
+    paused = getattr(_local, 'paused', False)
+    _local.paused = True
+    try:
+        yield
+    finally:
+        _local.paused = paused
+
+
+@contextmanager
+def assert_max_queries(limit):
+    with count_queries() as counter:
+        yield counter
+    if counter.count > limit:
+        raise QueryBudgetExceeded(
+            f'{counter.count} queries executed, budget is {limit}:\n' + '\n'.join(counter.statements)
+        )
+
+
+def init_query_budgets(app):
+    """Count queries per request and enforce QUERY_BUDGETS per endpoint.
+
+    Over-budget requests are logged; with QUERY_BUDGET_STRICT (or in
+    testing) they fail instead, so N+1 regressions break the test run.
+    """
+    _listen()
+
+    @app.after_request
+    def check_query_budget(response):
+        count = g.get('sql_query_count', 0)
+        if app.config.get('SQL_QUERY_COUNT_HEADER'):
+            response.headers['X-Query-Count'] = str(count)
+        budget = app.config.get('QUERY_BUDGETS', {}).get(request.endpoint)
+        if budget is not None and count > budget:
+            message = f'{request.endpoint} ran {count} queries (budget {budget})'
+            if app.config.get('QUERY_BUDGET_STRICT') or app.testing:
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(message)
+        return response
@@ -0,0 +1,93 @@
+from datetime import datetime
+from sqlalchemy import func, select
+from models import db
+from utils import stats
+from utils.circulation import open_loan_query
+from routes.admin_routes import overdue_loans_query
+from routes.book_routes import (book_reservations_query, catalog_query, categories_query,
+                                user_reservation_query)
+from routes.member_routes import (active_reservations_query, borrowing_history_query,
+                                  current_loans_query, members_query, recent_transactions_query,
+                                  unpaid_fines_query)
+from routes.transaction_routes import fines_query
+
+
+def page_count(query):
+    # The total that page-number pagination (and keyset with_total) counts
+    return select(func.count()).select_from(query.order_by(None).subquery())
+
+
+def route_queries(user_id=1, book_id=1):
+    """The statements the hot routes issue, keyed by a descriptive name.
+
+    Built with the same query helpers the routes call, limited to the page
+    size where the route paginates, plus the total page numbers count.
+    """
+    now = datetime.utcnow()
+    return {
+        'book_catalog': catalog_query().limit(12),
+        'book_catalog[category]': catalog_query('Fiction').limit(12),
+        'book_catalog[category][count]': page_count(catalog_query('Fiction')),
+        'book_catalog[search]': catalog_query(search='history').limit(12),
+        'book_catalog[search][count]': page_count(catalog_query(search='history')),
+        'book_catalog[categories]': categories_query(),
+        'book_details[user_reservation]': user_reservation_query(user_id, book_id).limit(1),
+        'book_details[reservation_count]': book_reservations_query(book_id),
+        'borrow_book[existing_loan]': open_loan_query(user_id, book_id).limit(1),
+        'dashboard[current_loans]': current_loans_query(user_id),
+        'dashboard[active_reservations]': active_reservations_query(user_id),
+        'dashboard[unpaid_fines]': unpaid_fines_query(user_id),
+        'dashboard[recent_transactions]': recent_transactions_query(user_id),
+        'borrowing_history': borrowing_history_query(user_id).limit(20),
+        'borrowing_history[count]': page_count(borrowing_history_query(user_id)),
+        'manage_members': members_query().limit(20),
+        'manage_members[count]': page_count(members_query()),
+        'reports[overdue]': overdue_loans_query(now).limit(50),
+        'reports[counters]': stats.counters_query(),
+        'reports[popular_books]': stats.popular_books_query(10),
+        'reports[active_members]': stats.active_members_query(10),
+        'reports[popular_books_window]': stats.popular_books_query(10, 30, 'Fiction'),
+        'reports[active_members_window]': stats.active_members_query(10, 30, 'Fiction'),
+        'view_fines': fines_query(user_id),
+    }
+
+
+def explain(query):
+    statement = query.statement if hasattr(query, 'statement') else query
+    compiled = statement.compile(dialect=db.engine.dialect,
+                                 compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+    return [row[-1] for row in rows]
+
+
+def is_full_scan(detail, limited=False, derived=()):
+    # "SCAN books" walks the whole table and "SCAN books USING [COVERING]
+    # INDEX ..." the whole index, unless a LIMIT stops an ordered walk
+    # early. Virtual (FTS) table scans and scans of small materialized
+    # subqueries and CTEs (anon_1, (subquery-1), ``derived``) are fine.
+    if not detail.startswith('SCAN ') or 'VIRTUAL TABLE' in detail or detail == 'SCAN CONSTANT ROW':
+        return False
+    if ' USING ' in detail and limited:
+        return False
+    source = detail.split()[1]
+    return not (source.startswith('anon_') or source.startswith('(') or source in derived)
+
+
+def find_full_scans(queries=None):
+    """Return {name: [plan lines]} for every query whose plan scans a table"""
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('Query plan checks require SQLite')
+    offenders = {}
+    for name, query in (queries or route_queries()).items():
+        statement = query.statement if hasattr(query, 'statement') else query
+        plan = explain(query)
+        # A LIMIT only cuts the walk short when the index gives the order
+        limited = statement._limit_clause is not None and not any(
+            'TEMP B-TREE FOR ORDER BY' in detail for detail in plan)
+        derived = {detail.split()[1] for detail in plan
+                   if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+        scans = [detail for detail in plan if is_full_scan(detail, limited, derived)]
+        if scans:
+            offenders[name] = scans
+    return offenders
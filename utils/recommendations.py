@@ -0,0 +1,176 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, distinct, func, insert, select
+from models import db
+from models.book import Book
+from models.job import JobRun
+from models.recommendation import BookRecommendation
+from models.stats import BookDailyStat
+from models.transaction import LoanRecord
+
+RECOMMENDATIONS_JOB = 'build_recommendations'
+
+
+def _scientific():
+    try:
+        import numpy as np
+        from scipy import sparse
+    except ImportError:
+        raise RuntimeError('Building recommendations needs the numpy and scipy packages')
+    return np, sparse
+
+
+def load_borrow_matrix(readers_of=None, chunk_size=100000):
+    """Binary member x book matrix of loans, live or archived.
+
+    Returns (matrix, user_ids, book_ids): a CSR matrix with one row per
+    member and one column per book that was borrowed, plus the ids the rows
+    and columns stand for. ``readers_of`` (a select of book ids) limits it
+    to the loans of members who borrowed one of those books, which is all
+    that scoring those books needs.
+    """
+    np, sparse = _scientific()
+    query = select(LoanRecord.user_id, LoanRecord.book_id)
+    if readers_of is not None:
+        query = query.where(LoanRecord.user_id.in_(
+            select(LoanRecord.user_id).where(LoanRecord.book_id.in_(readers_of))
+        ))
+    result = db.session.execute(query.execution_options(yield_per=chunk_size))
+    chunks = [np.fromiter((value for row in rows for value in row), dtype=np.int64,
+                          count=2 * len(rows)).reshape(-1, 2)
+              for rows in result.partitions()]
+    pairs = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+
+    user_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    book_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, columns)),
+        shape=(len(user_ids), len(book_ids))
+    )
+    # Borrowing the same book twice still counts once
+    matrix.data[:] = 1
+    return matrix, user_ids, book_ids
+
+
+def reader_counts(book_ids, readers_of):
+    """Distinct members who ever borrowed each of ``book_ids``, in the same order.
+
+    A matrix restricted with ``readers_of`` only holds some of each book's
+    readers, so its column sums can't be used as the norms.
+    """
+    np, _ = _scientific()
+    co_borrowed = select(LoanRecord.book_id).where(LoanRecord.user_id.in_(
+        select(LoanRecord.user_id).where(LoanRecord.book_id.in_(readers_of))
+    ))
+    counts = np.zeros(len(book_ids))
+    for book_id, count in db.session.execute(
+        select(LoanRecord.book_id, func.count(distinct(LoanRecord.user_id)))
+        .where(LoanRecord.book_id.in_(co_borrowed)).group_by(LoanRecord.book_id)
+    ):
+        counts[np.searchsorted(book_ids, book_id)] = count
+    return counts
+
+
+class CoBorrowing:
+    """Cosine similarity between books' sets of readers"""
+
+    def __init__(self, matrix, readers=None):
+        np, _ = _scientific()
+        self.matrix = matrix
+        self.by_book = matrix.tocsc()
+        if readers is None:
+            readers = np.asarray(matrix.sum(axis=0, dtype=np.float64)).ravel()
+        self.norms = np.sqrt(readers)
+
+    def top_similar(self, columns, top_n=6, min_common=2):
+        """Top ``top_n`` (column, score) lists for each of ``columns``.
+
+        Pairs with fewer than ``min_common`` readers in common are ignored,
+        so a single reader with eclectic taste doesn't create a
+        recommendation.
+        """
+        np, _ = _scientific()
+        # (columns x members) @ (members x books): co-borrow counts in one
+        # sparse product, which only stores the pairs that share a reader
+        common = (self.by_book[:, columns].T @ self.matrix).tocsr()
+        rows = np.repeat(np.arange(len(columns)), np.diff(common.indptr))
+        scores = common.data / (self.norms[columns][rows] * self.norms[common.indices])
+        scores[(common.data < min_common) | (common.indices == columns[rows])] = 0
+        return [_top_n(common.indices[start:end], scores[start:end], top_n)
+                for start, end in zip(common.indptr[:-1], common.indptr[1:])]
+
+
+def _top_n(columns, scores, top_n):
+    np, _ = _scientific()
+    if len(scores) > top_n:
+        top = np.argpartition(-scores, top_n - 1)[:top_n]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.lexsort((columns[top], -scores[top]))]
+    return [(int(columns[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+def _recent_books(since):
+    # Books borrowed since the last run, by day, from the leaderboard buckets
+    return select(BookDailyStat.book_id).where(BookDailyStat.day >= since.date()).distinct()
+
+
+def build_recommendations(full=False, top_n=None, min_common=None, batch_size=256, now=None):
+    """Refresh the "readers also borrowed" lists; returns the number of books refreshed.
+
+    A ``full`` run (and the first one) loads every loan into a sparse
+    matrix and scores every book, in batches of ``batch_size`` rows. Later
+    runs only rescore books borrowed since the previous one and only load
+    the loans of their readers; other books' lists can lag behind their
+    new co-borrowers until the next ``full`` rebuild (weekly is plenty).
+    """
+    np, _ = _scientific()
+    now = now or datetime.utcnow()
+    config = current_app.config
+    top_n = top_n or config.get('RECOMMENDATIONS_TOP_N', 6)
+    min_common = min_common or config.get('RECOMMENDATIONS_MIN_COMMON', 2)
+    job = db.session.get(JobRun, RECOMMENDATIONS_JOB) or JobRun(name=RECOMMENDATIONS_JOB)
+
+    if full or job.last_run_at is None:
+        matrix, user_ids, book_ids = load_borrow_matrix()
+        columns = np.arange(len(book_ids))
+        similarity = CoBorrowing(matrix)
+        # Books without loans any more (e.g. deleted) lose their lists
+        db.session.execute(delete(BookRecommendation).where(
+            BookRecommendation.book_id.not_in(select(LoanRecord.book_id))
+        ))
+    else:
+        recent = _recent_books(job.last_run_at)
+        matrix, user_ids, book_ids = load_borrow_matrix(recent)
+        changed = db.session.execute(recent).scalars().all()
+        columns = np.flatnonzero(np.isin(book_ids, np.array(changed, dtype=np.int64)))
+        similarity = CoBorrowing(matrix, reader_counts(book_ids, recent))
+
+    for start in range(0, len(columns), batch_size):
+        batch = columns[start:start + batch_size]
+        ids = book_ids[batch].tolist()
+        rows = [
+            {'book_id': book_id, 'rank': rank, 'recommended_book_id': int(book_ids[column]),
+             'score': round(score, 6)}
+            for book_id, similar in zip(ids, similarity.top_similar(batch, top_n, min_common))
+            for rank, (column, score) in enumerate(similar, 1)
+        ]
+        db.session.execute(delete(BookRecommendation).where(BookRecommendation.book_id.in_(ids)))
+        if rows:
+            db.session.execute(insert(BookRecommendation), rows)
+        db.session.commit()
+
+    job.last_run_at = now
+    job.rows_affected = len(columns)
+    db.session.add(job)
+    db.session.commit()
+    return len(columns)
+
+
+def recommendations_for(book_id):
+    """The stored list for a book, best first, in one primary key range read"""
+    return db.session.query(Book.id, Book.title, Book.author).join(
+        BookRecommendation, BookRecommendation.recommended_book_id == Book.id
+    ).filter(
+        BookRecommendation.book_id == book_id
+    ).order_by(BookRecommendation.rank).all()
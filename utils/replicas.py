@@ -0,0 +1,182 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request, session as cookie_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+LAST_WRITE_KEY = '_last_write'
+_listening = False
+
+
+def measure_lag(engine):
+    """Seconds the replica is behind its primary.
+
+    Runs on a raw DBAPI connection so the probe doesn't count towards the
+    query budget of whichever request happened to trigger it.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if engine.dialect.name != 'postgresql':
+            # A plain second database (e.g. a copied or synced SQLite file,
+            # best opened with ?mode=ro) has no replication status to ask about
+            cursor.execute('SELECT 1')
+            return 0.0
+        cursor.execute(
+            'SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 '
+            'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+            'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+        )
+        return float(cursor.fetchone()[0])
+    finally:
+        connection.close()
+
+
+class ReplicaSet:
+    """The replica binds and which of them are currently fit to read from.
+
+    A replica is used while its measured lag is within ``max_lag``; the lag
+    is re-measured at most every ``check_interval`` seconds, and a replica
+    that fails the check is skipped until the next one.
+    """
+
+    def __init__(self, bind_keys, max_lag=5.0, check_interval=5.0):
+        self.bind_keys = list(bind_keys)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def usable(self, key, engine):
+        now = time.monotonic()
+        with self._lock:
+            checked_at, usable = self._checked.get(key, (None, False))
+            if checked_at is not None and now - checked_at < self.check_interval:
+                return usable
+            # Claim the check so concurrent requests don't all probe at once
+            self._checked[key] = (now, usable)
+        try:
+            lag = measure_lag(engine)
+            usable = lag is not None and lag <= self.max_lag
+        except Exception:
+            # Raw driver errors as well as SQLAlchemy's own
+            current_app.logger.warning('Replica %s is unavailable', key, exc_info=True)
+            usable = False
+        with self._lock:
+            self._checked[key] = (time.monotonic(), usable)
+        return usable
+
+    def choose(self, engines):
+        candidates = [key for key in self.bind_keys if self.usable(key, engines[key])]
+        return random.choice(candidates) if candidates else None
+
+
+def _is_plain_select(clause):
+    return clause is not None and getattr(clause, 'is_select', False) \
+        and getattr(clause, '_for_update_arg', None) is None
+
+
+def _wrote_recently(max_lag):
+    last_write = cookie_session.get(LAST_WRITE_KEY)
+    return last_write is not None and time.time() - last_write < max_lag
+
+
+class RoutingSession(Session):
+    """Sends the SELECTs of read-only endpoints to a replica.
+
+    Only endpoints listed in REPLICA_ENDPOINTS are routed, and only while
+    the transaction hasn't written and the client hasn't written within
+    REPLICA_MAX_LAG_SECONDS, so everyone reads their own writes. Everything
+    else, including all writes and SELECT ... FOR UPDATE, uses the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not _is_plain_select(clause):
+            self.info['wrote'] = True
+        elif bind is None and not self.info.get('wrote'):
+            key = _replica_for_request()
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_for_request():
+    if not has_request_context() or g.get('db_primary'):
+        return None
+    replicas = current_app.extensions.get('replicas')
+    if replicas is None or not replicas.bind_keys:
+        return None
+    if 'db_replica' not in g:
+        # Decided once per request, so a page reads one consistent copy
+        g.db_replica = None
+        if request.endpoint in current_app.config.get('REPLICA_ENDPOINTS', ()) \
+                and not _wrote_recently(replicas.max_lag):
+            g.db_replica = replicas.choose(current_app.extensions['sqlalchemy'].engines)
+    return g.db_replica
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary inside the block, e.g. for data that gets cached"""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('db_primary', False)
+    g.db_primary = True
+    try:
+        yield
+    finally:
+        g.db_primary = previous
+
+
+def _note_committed_write(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        g.db_wrote = True
+
+
+def _forget_write(session, previous_transaction):
+    session.info.pop('wrote', None)
+
+
+def replica_binds(app):
+    """SQLALCHEMY_BINDS entries for DATABASE_REPLICA_URLS, added before db.init_app"""
+    urls = app.config.get('DATABASE_REPLICA_URLS') or []
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    keys = []
+    for index, url in enumerate(urls):
+        key = f'replica{index}'
+        binds[key] = url
+        keys.append(key)
+    app.config['SQLALCHEMY_BINDS'] = binds
+    return keys
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        event.listen(Session, 'after_commit', _note_committed_write)
+        event.listen(Session, 'after_soft_rollback', _forget_write)
+        _listening = True
+
+
+def init_replicas(app, bind_keys):
+    replicas = ReplicaSet(
+        bind_keys,
+        max_lag=app.config.get('REPLICA_MAX_LAG_SECONDS', 5.0),
+        check_interval=app.config.get('REPLICA_CHECK_INTERVAL_SECONDS', 5.0),
+    )
+    app.extensions['replicas'] = replicas
+    if not bind_keys:
+        return replicas
+    _listen()
+
+    @app.after_request
+    def remember_write(response):
+        # Pins this client to the primary until replicas have caught up
+        if g.get('db_wrote'):
+            cookie_session[LAST_WRITE_KEY] = time.time()
+        return response
+
+    return replicas
@@ -0,0 +1,102 @@
+import re
+from flask import current_app
+from sqlalchemy import or_, text, column, table
+from models import db
+from models.book import Book
+
+# External-content FTS5 table over the searchable Book columns. The
+# triggers keep it in sync with every insert, update and delete on books,
+# whether it comes from the ORM or from raw SQL.
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, isbn, category,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, isbn, category)
+        VALUES (new.id, new.title, new.author, new.isbn, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, isbn, category)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author, isbn, category ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, isbn, category)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category);
+        INSERT INTO books_fts(rowid, title, author, isbn, category)
+        VALUES (new.id, new.title, new.author, new.isbn, new.category);
+    END""",
+]
+
+books_fts = table('books_fts', column('rowid'), column('rank'))
+
+
+def search_index_supported():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def search_index_available():
+    state = current_app.extensions.setdefault('search_index', {})
+    if 'available' not in state:
+        state['available'] = search_index_supported() and db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='books_fts'")
+        ).first() is not None
+    return state['available']
+
+
+def create_search_index():
+    """Create the FTS table and sync triggers if they don't exist yet"""
+    if not search_index_supported():
+        return False
+    with db.engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='books_fts'")
+        ).first() is not None
+        for statement in SEARCH_INDEX_DDL:
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+    current_app.extensions.setdefault('search_index', {})['available'] = True
+    return True
+
+
+def rebuild_search_index():
+    """Repopulate the FTS table from books, e.g. after restoring a backup"""
+    if not create_search_index():
+        return False
+    with db.engine.begin() as conn:
+        conn.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+        conn.execute(text("INSERT INTO books_fts(books_fts) VALUES ('optimize')"))
+    return True
+
+
+def build_match_query(search):
+    # Every word must match, and the last characters typed are treated as a
+    # prefix so results appear while the user is still typing.
+    terms = re.findall(r'\w+', search)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_books(query, search):
+    """Filter a Book query by a catalog search string.
+
+    Uses the FTS index (ordered by relevance) when it is available and falls
+    back to the original ILIKE scan otherwise.
+    """
+    match = build_match_query(search)
+    if match and search_index_available():
+        return query.join(books_fts, books_fts.c.rowid == Book.id).filter(
+            text('books_fts MATCH :fts_match').bindparams(fts_match=match)
+        ).order_by(books_fts.c.rank)
+
+    search_term = f"%{search}%"
+    return query.filter(
+        or_(
+            Book.title.ilike(search_term),
+            Book.author.ilike(search_term),
+            Book.isbn.ilike(search_term),
+            Book.category.ilike(search_term)
+        )
+    )
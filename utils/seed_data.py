@@ -3,148 +3,245 @@ from models.user import User
 from models.book import Book
 from models.transaction import Transaction, Reservation, Fine
 from datetime import datetime, timedelta
+from flask import current_app
+from itertools import accumulate
 import random
+from sqlalchemy import func, bindparam
 from werkzeug.security import generate_password_hash
+from utils.stats import reconcile_stats
 
-def create_dummy_data():
-    """Create 50 users, 100 books, and sample transactions"""
-    
-    # Create Users (50 users)
-    users = []
-    roles = ['member'] * 45 + ['librarian'] * 4 + ['admin'] * 1
-    
-    for i in range(1, 51):
-        user = User(
-            username=f'user{i}',
-            email=f'user{i}@library.com',
-            password_hash=generate_password_hash('password123'),
-            role=roles[i-1],
-            first_name=f'First{i}',
-            last_name=f'Last{i}',
-            join_date=datetime.utcnow() - timedelta(days=random.randint(1, 365))
-        )
-        users.append(user)
-        db.session.add(user)
-    
-    db.session.commit()
-    print(f"Created {len(users)} users")
+CATEGORIES = ['Fiction', 'Science', 'Technology', 'History', 'Biography',
+              'Mathematics', 'Physics', 'Computer Science', 'Literature', 'Art']
 
-    books = []
-    categories = ['Fiction', 'Science', 'Technology', 'History', 'Biography', 
-                 'Mathematics', 'Physics', 'Computer Science', 'Literature', 'Art']
-    
-    authors = ['Author A', 'Author B', 'Author C', 'Author D', 'Author E',
-              'Author F', 'Author G', 'Author H', 'Author I', 'Author J']
-    
-    for i in range(1, 101):
-        category = random.choice(categories)
-        author = random.choice(authors)
-        
-        book = Book(
-            title=f'{category} Book {i}',
-            author=author,
-            isbn=f'978-{random.randint(1000000000, 9999999999)}',
-            category=category,
-            publisher=f'Publisher {(i % 5) + 1}',
-            publication_year=random.randint(1990, 2023),
-            total_copies=random.randint(1, 5),
-            available_copies=random.randint(1, 5),
-            location=f'Shelf {random.randint(1, 10)}-{random.randint(1, 50)}',
-            description=f'This is a sample description for {category} Book {i}',
-            status='available'
-        )
-        books.append(book)
-        db.session.add(book)
-    
-    db.session.commit()
-    print(f"Created {len(books)} books")
-    
-    transactions = []
-    member_users = [u for u in users if u.role == 'member']
-    
-    for i in range(30): 
-        user = random.choice(member_users)
-        book = random.choice([b for b in books if b.available_copies > 0])
-        
-        if book.available_copies > 0:
-            book.available_copies -= 1
-            if book.available_copies == 0:
-                book.status = 'checked_out'
-            
-            transaction = Transaction(
-                user_id=user.id,
-                book_id=book.id,
-                borrow_date=datetime.utcnow() - timedelta(days=random.randint(1, 20)),
-                due_date=datetime.utcnow() + timedelta(days=random.randint(1, 14)),
-                status='borrowed'
-            )
-            transactions.append(transaction)
-            db.session.add(transaction)
-
-    for i in range(50): 
-        user = random.choice(member_users)
-        book = random.choice(books)
-        
-        borrow_date = datetime.utcnow() - timedelta(days=random.randint(30, 180))
-        return_date = borrow_date + timedelta(days=random.randint(7, 21))
-        
-        transaction = Transaction(
-            user_id=user.id,
-            book_id=book.id,
-            borrow_date=borrow_date,
-            due_date=borrow_date + timedelta(days=14),
-            return_date=return_date,
-            status='returned'
-        )
-        transactions.append(transaction)
-        db.session.add(transaction)
-    
+def _zipf_cum_weights(count, exponent, rng):
+    """Cumulative Zipf weights over a shuffled id order, for rng.choices()"""
+    ranks = list(range(count))
+    rng.shuffle(ranks)
+    return list(accumulate(1.0 / (rank + 1) ** exponent for rank in ranks))
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _insert(model, rows):
+    if not rows:
+        return
+    if db.engine.dialect.name == 'sqlite':
+        # Pre-formatting datetimes and going straight to executemany skips
+        # SQLAlchemy's per-value bind processing, which dominates at scale.
+        columns = list(rows[0])
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            model.__tablename__, ', '.join(columns), ', '.join('?' * len(columns)))
+        db.session.connection().exec_driver_sql(sql, [
+            tuple(f'{value:%Y-%m-%d %H:%M:%S.%f}' if isinstance(value, datetime) else value
+                  for value in row.values())
+            for row in rows
+        ])
+    else:
+        db.session.execute(model.__table__.insert(), rows)
     db.session.commit()
-    print(f"Created {len(transactions)} transactions")
 
-    reservations = []
-    
-    for i in range(10):
-        user = random.choice(member_users)
-        borrowed_books = [t.book for t in Transaction.query.filter_by(status='borrowed').all()]
-        if borrowed_books:
-            book = random.choice(borrowed_books)
-            
-            reservation = Reservation(
-                user_id=user.id,
-                book_id=book.id,
-                reserve_date=datetime.utcnow() - timedelta(days=random.randint(1, 10)),
-                status='active'
-            )
-            reservations.append(reservation)
-            db.session.add(reservation)
-    
+
+def _drop_indexes(model):
+    """Drop secondary indexes before a large load; upgrade_database() rebuilds them"""
+    for index in model.__table__.indexes:
+        index.drop(bind=db.session.connection(), checkfirst=True)
     db.session.commit()
-    print(f"Created {len(reservations)} reservations")
-    
-    fines = []
-    overdue_transactions = [t for t in Transaction.query.filter_by(status='borrowed').all() 
-                          if t.due_date and t.due_date < datetime.utcnow()]
-    
-    for transaction in overdue_transactions[:15]: 
-        days_overdue = (datetime.utcnow() - transaction.due_date).days
-        fine_amount = days_overdue * 0.50
-        
-        fine = Fine(
-            user_id=transaction.user_id,
-            transaction_id=transaction.id,
-            amount=round(fine_amount, 2),
-            reason='overdue',
-            issue_date=transaction.due_date + timedelta(days=1)
+
+
+def generate_data(users=50, books=100, years=1, transactions=None, seed=42,
+                  loans_per_member_year=10, overdue_ratio=0.08, late_return_ratio=0.15,
+                  reservation_ratio=0.2, popularity_exponent=1.1, activity_exponent=0.8,
+                  batch_size=10000, defer_indexes=None, now=None, echo=print):
+    """Generate a reproducible library of the given size with bulk inserts.
+
+    Book popularity and member activity follow Zipf distributions, loans
+    are spread over ``years`` of history, a share of returns is late (and
+    fined), a share of recent loans is still out past its due date, and
+    fully lent-out books collect reservations. The same ``seed`` always
+    produces the same data relative to ``now``.
+    
+    Large loads (over a million loans unless ``defer_indexes`` says
+    otherwise) drop the loan and fine indexes first and rebuild them once
+    at the end, which is much cheaper than maintaining them row by row.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    history_days = max(1, int(years * 365))
+    # The circulation rules the app itself applies
+    loan_days = current_app.config.get('LOAN_PERIOD_DAYS', 14)
+    fine_per_day = current_app.config.get('FINE_PER_DAY', 0.50)
+
+    # Users: members first, then librarians, then admins (the 50-user
+    # default is 45 members, 4 librarians and 1 admin).
+    admins = max(1, users // 100000)
+    librarians = min(max(1, round(users * 0.08)), max(1, users // 50 + 3))
+    members = max(0, users - librarians - admins)
+    password_hash = generate_password_hash('password123')
+    first_user = _next_id(User)
+
+    rows = []
+    for i in range(users):
+        role = 'member' if i < members else 'librarian' if i < members + librarians else 'admin'
+        user_id = first_user + i
+        rows.append({
+            'id': user_id,
+            'username': f'user{user_id}',
+            'email': f'user{user_id}@library.com',
+            'password_hash': password_hash,
+            'role': role,
+            'first_name': f'First{user_id}',
+            'last_name': f'Last{user_id}',
+            'join_date': now - timedelta(days=rng.randint(1, history_days)),
+            'is_active': True,
+        })
+        if len(rows) >= batch_size:
+            _insert(User, rows)
+            rows = []
+    _insert(User, rows)
+    echo(f"Created {users} users")
+
+    first_book = _next_id(Book)
+    copies = [rng.randint(1, 5) for _ in range(books)]
+    rows = []
+    for i in range(books):
+        book_id = first_book + i
+        category = rng.choice(CATEGORIES)
+        rows.append({
+            'id': book_id,
+            'title': f'{category} Book {book_id}',
+            'author': f'Author {rng.randint(1, max(10, books // 20))}',
+            'isbn': f'978{book_id:010d}',
+            'category': category,
+            'publisher': f'Publisher {(book_id % 5) + 1}',
+            'publication_year': rng.randint(1990, now.year),
+            'total_copies': copies[i],
+            'available_copies': copies[i],
+            'location': f'Shelf {rng.randint(1, 10)}-{rng.randint(1, 50)}',
+            'description': f'This is a sample description for {category} Book {book_id}',
+            'status': 'available',
+            'created_date': now - timedelta(days=rng.randint(history_days, history_days + 365)),
+        })
+        if len(rows) >= batch_size:
+            _insert(Book, rows)
+            rows = []
+    _insert(Book, rows)
+    echo(f"Created {books} books")
+
+    if members == 0 or books == 0:
+        reconcile_stats()
+        return
+
+    if transactions is None:
+        transactions = int(members * years * loans_per_member_year)
+    if defer_indexes is None:
+        defer_indexes = transactions > 1000000
+    if defer_indexes:
+        _drop_indexes(Transaction)
+        _drop_indexes(Fine)
+    book_weights = _zipf_cum_weights(books, popularity_exponent, rng)
+    member_weights = _zipf_cum_weights(members, activity_exponent, rng)
+    book_ids = range(first_book, first_book + books)
+    member_ids = range(first_user, first_user + members)
+
+    # Only open loans need tracking: they must fit the copies on the shelf
+    # and a member can't hold the same book twice.
+    open_per_book = {}
+    open_pairs = set()
+    next_transaction = _next_id(Transaction)
+    next_fine = _next_id(Fine)
+    loan_rows, fine_rows = [], []
+    created = fines_created = 0
+
+    while created < transactions:
+        count = min(batch_size, transactions - created)
+        chosen_books = rng.choices(book_ids, cum_weights=book_weights, k=count)
+        chosen_members = rng.choices(member_ids, cum_weights=member_weights, k=count)
+        for book_id, user_id in zip(chosen_books, chosen_members):
+            age = rng.random() * history_days
+            borrow_date = now - timedelta(days=age)
+            due_date = borrow_date + timedelta(days=loan_days)
+            row = {'id': next_transaction, 'user_id': user_id, 'book_id': book_id,
+                   'borrow_date': borrow_date, 'due_date': due_date,
+                   'return_date': None, 'status': 'borrowed', 'renewal_count': 0}
+
+            keep_open = (age < loan_days and rng.random() < 0.7) or \
+                        (age < 4 * loan_days and rng.random() < overdue_ratio)
+            index = book_id - first_book
+            if keep_open and (user_id, book_id) not in open_pairs \
+                    and open_per_book.get(book_id, 0) < copies[index]:
+                open_pairs.add((user_id, book_id))
+                open_per_book[book_id] = open_per_book.get(book_id, 0) + 1
+            else:
+                if rng.random() < late_return_ratio:
+                    return_date = due_date + timedelta(days=rng.randint(1, 30), hours=rng.randint(0, 23))
+                else:
+                    return_date = borrow_date + timedelta(days=rng.randint(1, loan_days))
+                return_date = min(return_date, now)
+                row.update(return_date=return_date, status='returned')
+                if return_date > due_date:
+                    paid = rng.random() < 0.8
+                    fine_rows.append({
+                        'id': next_fine, 'user_id': user_id, 'transaction_id': next_transaction,
+                        'amount': round((return_date - due_date).days * fine_per_day, 2),
+                        'reason': 'overdue', 'issue_date': return_date,
+                        'paid_date': min(return_date + timedelta(days=rng.randint(0, 30)), now) if paid else None,
+                        'status': 'paid' if paid else 'unpaid',
+                    })
+                    next_fine += 1
+            loan_rows.append(row)
+            next_transaction += 1
+
+        _insert(Transaction, loan_rows)
+        _insert(Fine, fine_rows)
+        created += len(loan_rows)
+        fines_created += len(fine_rows)
+        loan_rows, fine_rows = [], []
+        if created % (batch_size * 10) == 0:
+            echo(f"  ... {created} transactions")
+    echo(f"Created {created} transactions ({len(open_pairs)} open) and {fines_created} fines")
+    
+    if defer_indexes:
+        from utils.migrations import create_missing_indexes
+        create_missing_indexes()
+        echo("Rebuilt loan and fine indexes")
+
+    availability = [
+        {'b_id': book_id, 'available': copies[book_id - first_book] - on_loan,
+         'status': 'available' if copies[book_id - first_book] > on_loan else 'checked_out'}
+        for book_id, on_loan in open_per_book.items()
+    ]
+    if availability:
+        db.session.execute(
+            Book.__table__.update().where(Book.__table__.c.id == bindparam('b_id')).values(
+                available_copies=bindparam('available'), status=bindparam('status')),
+            availability
         )
-        fines.append(fine)
-        db.session.add(fine)
-    
-    for fine in fines[:5]:
-        fine.status = 'paid'
-        fine.paid_date = datetime.utcnow()
-    
-    db.session.commit()
-    print(f"Created {len(fines)} fines")
-    
-    print("Dummy data creation completed!")
\ No newline at end of file
+        db.session.commit()
+
+    # Waiting lists form on the books that are fully lent out
+    full_books = [book_id for book_id, on_loan in open_per_book.items()
+                  if on_loan >= copies[book_id - first_book]]
+    rows, reserved = [], set()
+    first_reservation = _next_id(Reservation)
+    if full_books:
+        for _ in range(int(len(open_pairs) * reservation_ratio)):
+            user_id = rng.choice(member_ids)
+            book_id = rng.choice(full_books)
+            if (user_id, book_id) in reserved or (user_id, book_id) in open_pairs:
+                continue
+            reserved.add((user_id, book_id))
+            rows.append({'id': first_reservation + len(rows), 'user_id': user_id, 'book_id': book_id,
+                         'reserve_date': now - timedelta(days=rng.randint(0, loan_days)),
+                         'status': 'active', 'notification_sent': False})
+    _insert(Reservation, rows)
+    echo(f"Created {len(rows)} reservations")
+
+    reconcile_stats()
+
+
+def create_dummy_data():
+    """Create 50 users, 100 books, and sample transactions"""
+    generate_data(users=50, books=100, years=1, transactions=200)
+    print("Dummy data creation completed!")
@@ -0,0 +1,131 @@
+import os
+import time
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from models import db
+from utils.fuzzy import catalog_index, fuzzy_search_enabled
+
+# STARTUP_MODE selects how a worker comes up:
+#   default    - templates compiled on first use, nothing primed
+#   production - persistent template bytecode cache (TEMPLATE_CACHE_DIR,
+#                default instance/jinja-cache), and warmup() in each worker
+#                once it has forked (see post_worker_init)
+STARTUP_MODES = ('default', 'production')
+
+
+def resolve_mode(app):
+    mode = app.config.get('STARTUP_MODE') or 'default'
+    if mode not in STARTUP_MODES:
+        raise ValueError(f'Unknown STARTUP_MODE {mode!r}; expected one of {STARTUP_MODES}')
+    return mode
+
+
+def template_cache_dir(app):
+    directory = app.config.get('TEMPLATE_CACHE_DIR')
+    if not directory and resolve_mode(app) == 'production':
+        directory = os.path.join(app.instance_path, 'jinja-cache')
+    return directory
+
+
+def init_startup(app):
+    """Install the template bytecode cache; must run before app.jinja_env is used"""
+    mode = resolve_mode(app)
+    directory = template_cache_dir(app)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(directory))
+    if mode == 'production':
+        # Templates only change with a deploy, so don't stat them per render
+        app.config['TEMPLATES_AUTO_RELOAD'] = False
+    app.extensions['startup_mode'] = mode
+    return mode
+
+
+def precompile_templates(app):
+    """Compile every template into the bytecode cache (for a build step)"""
+    env = app.jinja_env
+    names = [name for name in env.list_templates() if name.endswith('.html')]
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+def _prime_pool(engine, connections):
+    # Check out several connections at once so the pool really opens that
+    # many, rather than reusing the first one
+    opened = []
+    try:
+        for _ in range(connections):
+            connection = engine.connect()
+            connection.execute(text('SELECT 1'))
+            opened.append(connection)
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+
+def _replay_requests(app, paths, username):
+    # Real GETs compile the hot SQL statements into the engine's statement
+    # cache, which nothing short of executing them does
+    from models.user import User
+
+    client = app.test_client()
+    if username:
+        with app.app_context():
+            user_id = db.session.query(User.id).filter(User.username == username).scalar()
+        if user_id is not None:
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+    for path in paths:
+        client.get(path)
+
+
+def warmup(app):
+    """Prime a worker before it takes traffic; returns {phase: seconds}.
+
+    Configures the ORM mappers, opens WARMUP_POOL_CONNECTIONS connections on
+    every engine, loads WARMUP_TEMPLATES (from the bytecode cache when
+    there is one) and the fuzzy search index (from its snapshot when there
+    is one), starts the password hashing workers and requests
+    WARMUP_PATHS, signed in as WARMUP_USER if one is set. It opens
+    connections and starts processes, so call it in the worker after the
+    server forks (see post_worker_init), never in the app factory.
+    """
+    timings = {}
+
+    def phase(name, fn):
+        started = time.perf_counter()
+        fn()
+        timings[name] = time.perf_counter() - started
+
+    connections = app.config.get('WARMUP_POOL_CONNECTIONS', 2)
+    with app.app_context():
+        phase('mappers', configure_mappers)
+        phase('pool', lambda: [_prime_pool(engine, connections) for engine in db.engines.values()])
+        phase('templates', lambda: [app.jinja_env.get_template(name)
+                                    for name in app.config.get('WARMUP_TEMPLATES', ())])
+        if fuzzy_search_enabled(app):
+            phase('search_index', lambda: catalog_index(app))
+        hasher = app.extensions.get('password_hasher')
+        if hasher is not None:
+            phase('password_hasher', hasher.warmup)
+    phase('requests', lambda: _replay_requests(app, app.config.get('WARMUP_PATHS', ()),
+                                               app.config.get('WARMUP_USER')))
+
+    app.logger.info('Warmup: ' + ', '.join(f'{name} {seconds * 1000:.0f}ms'
+                                            for name, seconds in timings.items()))
+    return timings
+
+
+def post_worker_init(worker):
+    """gunicorn hook: warm each worker up after the fork in production mode.
+
+    Enable it from gunicorn.conf.py with
+    ``from utils.startup import post_worker_init``.
+    """
+    app = worker.wsgi
+    if app.extensions.get('startup_mode') == 'production':
+        warmup(app)
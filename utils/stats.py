@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta
+from sqlalchemy import Date, cast, func, literal, select, delete, insert
+from models import db
+from models.user import User
+from models.book import Book
+from models.transaction import Transaction, Fine, LoanRecord
+from models.stats import LibraryCounter, BookStat, UserStat, BookDailyStat, UserDailyStat
+from utils.helpers import upsert_increment, upsert_increment_many, upsert_increment_from_select
+
+# Running totals shown on /reports. Each circulation code path calls the
+# matching record_* function inside its own transaction, so the counters
+# commit (or roll back) together with the change they describe.
+COUNTERS = ('books', 'members', 'borrowed', 'unpaid_fines')
+
+
+def bump(name, count=1, amount=0.0):
+    upsert_increment(LibraryCounter, {'name': name}, {'count': count, 'amount': amount})
+
+
+def record_book_added(count=1):
+    bump('books', count)
+
+
+def record_member_added(count=1):
+    bump('members', count)
+
+
+def record_borrow(book_id, user_id, day=None):
+    record_borrows(user_id, [book_id], day)
+
+
+def record_borrows(user_id, book_ids, day=None):
+    day = day or datetime.utcnow().date()
+    bump('borrowed', len(book_ids))
+    rows = [{'book_id': book_id} for book_id in book_ids]
+    upsert_increment_many(BookStat, rows, {'borrow_count': 1})
+    upsert_increment(UserStat, {'user_id': user_id}, {'borrow_count': len(book_ids)})
+    upsert_increment_many(BookDailyStat, [dict(row, day=day) for row in rows], {'borrow_count': 1})
+    # One bucket per category borrowed from, categories read in the same statement
+    upsert_increment_from_select(
+        UserDailyStat, ['day', 'user_id', 'category'], 'borrow_count',
+        select(literal(day, Date), literal(user_id), Book.category, func.count())
+        .where(Book.id.in_(book_ids)).group_by(Book.category)
+    )
+
+
+def record_return(count=1):
+    bump('borrowed', -count)
+
+
+def record_fine_paid(amount):
+    bump('unpaid_fines', -1, -amount)
+
+
+def counters_query():
+    return LibraryCounter.query.filter(LibraryCounter.name.in_(COUNTERS))
+
+
+def get_counters():
+    counters = {name: LibraryCounter(name=name, count=0, amount=0.0) for name in COUNTERS}
+    for counter in counters_query():
+        counters[counter.name] = counter
+    return counters
+
+
+def _top(model, stat, key, limit):
+    # Take the top rows from the borrow_count index first, then join, so the
+    # planner never starts from the (much larger) books/users table.
+    top = db.session.query(key, stat.borrow_count).filter(
+        stat.borrow_count > 0
+    ).order_by(stat.borrow_count.desc()).limit(limit).subquery()
+    return db.session.query(model, top.c.borrow_count).join(
+        top, top.c[key.key] == model.id
+    ).order_by(top.c.borrow_count.desc())
+
+
+def _window_start(days, today=None):
+    return (today or datetime.utcnow().date()) - timedelta(days=days - 1)
+
+
+def _windowed_top(model, bucket, key, limit, days, category, today):
+    # Sum the window's daily buckets, then join the top ids to their rows.
+    # days=None sums every bucket (only used with a category filter).
+    total = func.sum(bucket.borrow_count).label('borrow_count')
+    top = db.session.query(key, total)
+    if days is not None:
+        top = top.filter(bucket.day >= _window_start(days, today))
+    if category:
+        if bucket is BookDailyStat:
+            top = top.join(Book, Book.id == bucket.book_id).filter(Book.category == category)
+        else:
+            top = top.filter(bucket.category == category)
+    top = top.group_by(key).order_by(total.desc(), key).limit(limit).subquery()
+    return db.session.query(model, top.c.borrow_count).join(
+        top, top.c[key.key] == model.id
+    ).order_by(top.c.borrow_count.desc(), model.id)
+
+
+def popular_books_query(limit=10, days=None, category=None, today=None):
+    """Most borrowed books, all time or over the last ``days`` days"""
+    if days is None and not category:
+        return _top(Book, BookStat, BookStat.book_id, limit)
+    return _windowed_top(Book, BookDailyStat, BookDailyStat.book_id, limit, days, category, today)
+
+
+def active_members_query(limit=10, days=None, category=None, today=None):
+    """Members who borrowed most, optionally only books from ``category``"""
+    if days is None and not category:
+        return _top(User, UserStat, UserStat.user_id, limit)
+    return _windowed_top(User, UserDailyStat, UserDailyStat.user_id, limit, days, category, today)
+
+
+def popular_books(limit=10, days=None, category=None):
+    return popular_books_query(limit, days, category).all()
+
+
+def active_members(limit=10, days=None, category=None):
+    return active_members_query(limit, days, category).all()
+
+
+def _day(column):
+    # SQLite keeps dates as 'YYYY-MM-DD' text, which date() produces
+    if db.engine.dialect.name == 'sqlite':
+        return func.date(column)
+    return cast(column, Date)
+
+
+def rebuild_daily_stats():
+    """Recompute the per-day leaderboard buckets from every loan, live or archived"""
+    day = _day(LoanRecord.borrow_date)
+    db.session.execute(delete(BookDailyStat))
+    db.session.execute(insert(BookDailyStat).from_select(
+        ['day', 'book_id', 'borrow_count'],
+        select(day, LoanRecord.book_id, func.count()).group_by(day, LoanRecord.book_id)
+    ))
+    db.session.execute(delete(UserDailyStat))
+    db.session.execute(insert(UserDailyStat).from_select(
+        ['day', 'user_id', 'category', 'borrow_count'],
+        select(day, LoanRecord.user_id, Book.category, func.count())
+        .join(Book, Book.id == LoanRecord.book_id)
+        .group_by(day, LoanRecord.user_id, Book.category)
+    ))
+
+
+def reconcile_stats():
+    """Rebuild every counter and per-book/per-user total from the source tables"""
+    totals = {
+        'books': (db.session.query(func.count(Book.id)).scalar(), 0.0),
+        'members': (User.query.filter_by(role='member').count(), 0.0),
+        'borrowed': (Transaction.query.filter_by(status='borrowed').count(), 0.0),
+        'unpaid_fines': db.session.query(
+            func.count(Fine.id), func.coalesce(func.sum(Fine.amount), 0.0)
+        ).filter_by(status='unpaid').one(),
+    }
+
+    db.session.execute(delete(LibraryCounter))
+    for name, (count, amount) in totals.items():
+        db.session.add(LibraryCounter(name=name, count=count, amount=round(amount, 2)))
+
+    db.session.execute(delete(BookStat))
+    db.session.execute(insert(BookStat).from_select(
+        ['book_id', 'borrow_count'],
+        select(LoanRecord.book_id, func.count(LoanRecord.id)).group_by(LoanRecord.book_id)
+    ))
+    db.session.execute(delete(UserStat))
+    db.session.execute(insert(UserStat).from_select(
+        ['user_id', 'borrow_count'],
+        select(LoanRecord.user_id, func.count(LoanRecord.id)).group_by(LoanRecord.user_id)
+    ))
+    rebuild_daily_stats()
+    db.session.commit()
+    return totals